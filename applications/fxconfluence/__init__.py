@@ -1,26 +1,123 @@
 from collections import defaultdict
+import hashlib
+import threading
 
 from confluence import Api
 
 from fxi.apps import AppBase
+from .index import TitleIndex, normalize
 from .parser import Parser
+from .store import TreeStore
+
+
+def get_fingerprint(pages):
+    """
+    Summarize a space pages listing (that carries no modification
+    dates) so a changed tree can be told from an unchanged one.
+    """
+    digest = hashlib.sha1()
+    for page in pages:
+        digest.update(f'{page["id"]}\t{page["parentId"]}\t{page["title"]}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def format_space(space):
+    num_pages = len(space["pages"])
+    return f'{space["key"]:>10}: {space["name"]:>30} ({num_pages} pages)'
+
+
+class SpacesSync:
+    """
+    One sync of every space.
+
+    Spaces are loaded in parallel (see `App.max_workers`), each one
+    listed in `monitor` (if any) as soon as its pages arrive, and the
+    last one to finish wraps it up. A space that fails to load keeps
+    its cached tree.
+    """
+
+    def __init__(self, app, entries, monitor=None):
+        self.app = app
+        self.entries = entries
+        self.monitor = monitor
+        self.lock = threading.Lock()
+        self.pending = len(entries)
+        self.changed = 0
+        self.failed = 0
+
+    def start(self, submit):
+        if not self.entries:
+            self.finish()
+        for entry in self.entries:
+            submit(self.load_space, entry)
+
+    def load_space(self, entry):
+        key = entry['key']
+        try:
+            changed = self.app.sync_space(entry)
+        except Exception as ex:
+            the_type = type(ex)
+            error = f'{the_type}: {ex}'
+            changed = False
+        else:
+            error = None
+
+        with self.lock:
+            self.pending -= 1
+            self.changed += changed
+            self.failed += error is not None
+            done = self.pending == 0
+
+        if self.monitor:
+            if error:
+                self.monitor.write(f'{key:>10}: {error}')
+            else:
+                self.monitor.write(format_space(self.app.spaces[key]))
+
+        if done:
+            self.finish()
+
+    def finish(self):
+        current_keys = {entry['key'] for entry in self.entries}
+        for key in tuple(self.app.spaces):
+            if key not in current_keys:
+                self.app.store.delete_space(self.app.wiki, key)
+                self.app.remove_space(key)
+                self.changed += 1
+
+        if self.failed:
+            self.app.info(f'{self.changed} spaces updated, {self.failed} failed to load.')
+        elif self.changed:
+            self.app.info(f'{self.changed} spaces updated.')
+        else:
+            self.app.info()
 
 
 class App(AppBase):
     title = 'Confluence'
 
+    @property
+    def max_workers(self):
+        return int(self.get_config('parallelism', 8))
+
     def init(self):
         self.current_page = None
         self.current_space = None
         self.spaces = {}
         self.pages_tree = {}
         self.pages = {}
+        self.titles = TitleIndex()
         self.entries = []
+        self.api = None
+        self.local = threading.local()
+        self.store = TreeStore()
 
         self.connect()
-        self.load_spaces()
-
-        self.enqueue(self.cmd__l)
+        # Show what we already know while checking what changed:
+        cached = self.load_cached_spaces()
+        if cached:
+            self.enqueue(self.cmd__l)
+        self.enqueue_background(self.sync_spaces, show=not cached)
 
     def connect(self):
         url = self.get_config_or_ask('url', label='URL (usually ends in "/wiki")')
@@ -31,6 +128,7 @@ class App(AppBase):
         with self.info('Conecting...'):
             try:
                 self.api = Api(url, username, password)
+                self.credentials = (url, username, password)
             except Exception as ex:
                 the_type = type(ex)
                 self.info(f'{the_type}: {ex}')
@@ -38,70 +136,150 @@ class App(AppBase):
             else:
                 self.persist_unsaved_config()
 
-    def load_spaces(self):
-        with self.info('Loading spaces list'):
-            for entry in self.api.listspaces():
-                name = entry['name']
-                key = entry['key']
-                status = entry['status']
-
-                if status == 'CURRENT':
-                    try:
-                        pages_tree = self.load_pages(key)
-                    except Exception as ex:
-                        print(f' {ex}')
-                        del self.pages_tree[key]
-                        continue
-
-                    self.spaces[key] = {
-                        'key': key,
-                        'name': name,
-                        'type': entry['type'],
-                        'url': entry['url'],
-                        'pages': pages_tree,
-                    }
-            # TODO: persist it somewhere? It doesn't change that much.
+    def get_api(self):
+        """The XML-RPC client isn't thread-safe: use one per worker thread."""
+        api = getattr(self.local, 'api', None)
+        if api is None:
+            api = self.local.api = Api(*self.credentials)
+        return api
+
+    @property
+    def wiki(self):
+        return self.get_config('url')
+
+    def load_cached_spaces(self):
+        spaces = self.store.load(self.wiki)
+        for space in spaces.values():
+            self.set_space(space, space.pop('pages'))
+        return spaces
+
+    def sync_spaces(self, show=False):
+        """
+        Reload the pages listing of every space, saving
+        only the spaces whose tree has changed.
+        """
+        if self.api is None:
+            return
+
+        self.info('Loading spaces list...')
+        entries = [entry for entry in self.get_api().listspaces() if entry['status'] == 'CURRENT']
+        self.info(f'Loading {len(entries)} spaces...')
+
+        if show:
+            sync = SpacesSync(self, entries, self.open_monitor('Spaces'))
+            sync.start(self.enqueue)
+        else:
+            sync = SpacesSync(self, entries)
+            sync.start(self.enqueue_background)
+
+    def sync_space(self, entry):
+        """Reload one space and tell whether it has changed."""
+        key = entry['key']
+        pages = self.load_pages(key)
+        space = {
+            'key': key,
+            'name': entry['name'],
+            'type': entry['type'],
+            'url': entry['url'],
+            'fingerprint': get_fingerprint(pages),
+        }
+        old_space = self.spaces.get(key)
+        if old_space and all(old_space[name] == value for name, value in space.items()):
+            return False
+
+        self.store.save_space(self.wiki, space, pages, space['fingerprint'])
+        self.set_space(space, pages)
+        return True
 
     def load_pages(self, space_key):
-        tree = self.pages_tree[space_key] = defaultdict(list)
-        for page, _ in self.api.listpages(space_key):
+        return [page for page, _ in self.get_api().listpages(space_key)]
+
+    def set_space(self, space, pages):
+        self.forget_pages(space['key'])
+
+        tree = self.pages_tree[space['key']] = defaultdict(list)
+        for page in pages:
             parent_id = page['parentId']
             tree[parent_id].append(page)
 
             self.pages[page['id']] = page
+        self.titles.add(pages)
+
+        self.spaces[space['key']] = dict(space, pages=tree)
 
-        return tree
+    def forget_pages(self, key):
+        tree = self.pages_tree.pop(key, {})
+        for children in tree.values():
+            # Page ids are wiki-wide: a page that moved to
+            # another space (already loaded) belongs to it now.
+            owned = [
+                page for page in children
+                if self.pages.get(page['id'], page).get('space', key) == key
+            ]
+            self.titles.remove(owned)
+            for page in owned:
+                self.pages.pop(page['id'], None)
+
+    def remove_space(self, key):
+        self.forget_pages(key)
+        del self.spaces[key]
 
     def cmd__l(self):
         monitor = self.open_monitor('Spaces')
-        for space in self.spaces.values():
-            num_pages = len(space["pages"])
-            line = f'{space["key"]:>10}: {space["name"]:>30} ({num_pages} pages)'
-            monitor.write(line)
+        # Spaces may be added while we're listing them:
+        for space in tuple(self.spaces.values()):
+            monitor.write(format_space(space))
 
-    def cmd__v(self, key, debug=False):
+    def cmd__v(self, *words):
         """
         View page.
 
-        Usage: v <space_key> <page title>
+        Usage: v <space_key|index|page title> [debug]
 
-        For now, you must write down the entire
-        page title. Case sensitive. This surely
-        will change in the future.
+        Titles may be written in any case and only
+        partially: the page with that exact title or,
+        if there's none, a list of the closest matches
+        is shown.
         """
 
-        debug = bool(debug)
+        words = [f'{word}' for word in words]
+        debug = len(words) > 1 and words[-1] == 'debug'
+        if debug:
+            words = words[:-1]
+        key = ' '.join(words)
 
         if key in self.spaces:
-            space = self.spaces[key]
             self.current_space = key
-            pages_tree = space['pages']
-            page = pages_tree['0'][0]
+            page = self.spaces[key]['pages']['0'][0]
+        elif key.isdigit():
+            page = self.entries[int(key)]
         else:
-            space = self.spaces[self.current_space]
-            index = int(key)
-            pages_tree = space['pages']
-            page = self.entries[index]
+            page = self.find_page(key)
+            if page is None:
+                return
+
+        self.show_page(page, debug)
+
+    def find_page(self, title):
+        pages = [self.pages[page_id] for page_id in self.titles.find(title) if page_id in self.pages]
+        if not pages:
+            self.info(f'No page found for "{title}".')
+            return None
+
+        # Same title in many spaces? The current one comes first:
+        pages.sort(key=lambda page: page.get('space') != self.current_space)
+        if len(pages) == 1 or normalize(pages[0]['title']) == normalize(title):
+            return pages[0]
+
+        monitor = self.open_monitor('Matches')
+        self.entries = pages
+        for index, page in enumerate(pages):
+            monitor.write(f'{index:>4}: {page["title"]} ({page.get("space", "")})')
+        return None
+
+    def show_page(self, page, debug=False):
+        self.current_space = page.get('space', self.current_space)
+        pages_tree = self.pages_tree[self.current_space]
 
         page_id = page['id']
         children = pages_tree.get(page_id, None)
@@ -128,7 +306,7 @@ class App(AppBase):
             monitor.write('No children pages.')
 
         monitor.hr()
-        self.enqueue(self.load_page, page, monitor, debug)
+        monitor.enqueue(self.load_page, page, monitor, debug)
 
     def cmd__b(self):
         """
@@ -141,10 +319,16 @@ class App(AppBase):
             self.info('No entry "0" to go')
 
     def load_page(self, page, monitor, debug=False):
-        content_page = self.api.getpage(page['title'], self.current_space)
+        monitor.h1(page['title'])
+        content_page = self.get_api().getpage(page['title'], self.current_space)
         content = content_page['content']
 
-        monitor.h1(page['title'])
         parser = Parser(monitor)
         parser.debug = debug
-        parser.feed(content)
+        self.parse_page(parser.parse(content), monitor)
+
+    def parse_page(self, chunks, monitor):
+        # One chunk per task, so other tasks (and closing the
+        # monitor, that cancels the rest) don't wait for huge pages.
+        if next(chunks, None) is not None:
+            monitor.enqueue(self.parse_page, chunks, monitor)
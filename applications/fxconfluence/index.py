@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from collections import defaultdict
+import threading
+
+
+MIN_SIMILARITY = 0.3
+
+
+def normalize(title):
+    return ' '.join(title.casefold().split())
+
+
+def get_trigrams(text):
+    text = f'  {text} '
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+class TitleIndex:
+    """
+    Pages by title: exact (ignoring case and spacing), by prefix
+    (bisecting a sorted list) and fuzzy (by trigrams in common).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.titles = {}
+        self.exact = defaultdict(list)
+        self.trigrams = defaultdict(set)
+        self.sorted_titles = []
+        self.sorted = True
+
+    def add(self, pages):
+        with self.lock:
+            for page in pages:
+                page_id = page['id']
+                # Pages can move between spaces (and get here twice):
+                self.discard(page_id)
+
+                title = normalize(page['title'])
+                self.titles[page_id] = title
+                self.exact[title].append(page_id)
+                for trigram in get_trigrams(title):
+                    self.trigrams[trigram].add(page_id)
+            # Sorting again is left to the next lookup:
+            self.sorted = False
+
+    def remove(self, pages):
+        with self.lock:
+            for page in pages:
+                self.discard(page['id'])
+            self.sorted = False
+
+    def discard(self, page_id):
+        # Must be called with `self.lock` held.
+        title = self.titles.pop(page_id, None)
+        if title is None:
+            return
+
+        self.exact[title].remove(page_id)
+        if not self.exact[title]:
+            del self.exact[title]
+        for trigram in get_trigrams(title):
+            self.trigrams[trigram].discard(page_id)
+
+    def find(self, query, limit=20):
+        """
+        Ids of the pages matching `query`: the ones with that exact
+        title or, if there's none, the ones whose title starts with
+        it or, if there's none either, the most similar ones.
+        """
+        query = normalize(query)
+        with self.lock:
+            if query in self.exact:
+                return self.exact[query][:limit]
+            return self.find_prefixed(query, limit) or self.find_similar(query, limit)
+
+    def find_prefixed(self, query, limit):
+        # Must be called with `self.lock` held.
+        if not self.sorted:
+            self.sorted_titles = sorted((title, page_id) for page_id, title in self.titles.items())
+            self.sorted = True
+
+        found = []
+        index = bisect_left(self.sorted_titles, (query,))
+        while index < len(self.sorted_titles) and len(found) < limit:
+            title, page_id = self.sorted_titles[index]
+            if not title.startswith(query):
+                break
+            found.append(page_id)
+            index += 1
+        return found
+
+    def find_similar(self, query, limit):
+        # Must be called with `self.lock` held.
+        query_trigrams = get_trigrams(query)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for page_id in self.trigrams.get(trigram, ()):
+                shared[page_id] += 1
+
+        scores = []
+        for page_id, count in shared.items():
+            # (Counting repeated trigrams too, which is close enough.)
+            title_trigrams_count = len(self.titles[page_id]) + 1
+            similarity = count / (len(query_trigrams) + title_trigrams_count - count)
+            if similarity >= MIN_SIMILARITY:
+                scores.append((similarity, page_id))
+
+        scores.sort(key=lambda item: item[0], reverse=True)
+        return [page_id for _, page_id in scores[:limit]]
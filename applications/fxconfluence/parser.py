@@ -1,6 +1,7 @@
 from html.parser import HTMLParser
 import re
 
+from fxi.dispatcher import ui_operation
 from fxi.table import Table
 from collections import deque
 
@@ -11,6 +12,23 @@ SIZE = 10
 DEFAULT_FMT = (FONT, SIZE)
 CLEAR = None
 
+# Text is written one paragraph at a time: these tags end paragraphs.
+BLOCK_TAGS = {
+    'p', 'div', 'hr', 'pre', 'blockquote',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'ul', 'ol', 'li', 'table', 'tr', 'th', 'td',
+    'ac:structured-macro', 'ac:layout-section', 'ac:layout-cell', 'ac:plain-text-body',
+}
+
+# Text inside these is written as it is:
+PREFORMATTED_TAGS = {'pre', 'ac:plain-text-body'}
+
+# How much of a page body is parsed at a time:
+FEED_CHUNK_SIZE = 32 * 1024
+
+# Marks a <br/> in collected text (where newlines are just spaces):
+LINE_BREAK = '\x00'
+
 
 class BaseParser(HTMLParser):
     def __init__(self, monitor, *args, **kwargs):
@@ -19,13 +37,49 @@ class BaseParser(HTMLParser):
         self.format_stack = deque([DEFAULT_FMT])
         self.attrs = {}
         self.debug = False
+        # Pieces of text of the current paragraph, as [text, format]:
+        self.runs = []
+        # How deep inside preformatted tags we are:
+        self.preformatted = 0
 
     @staticmethod
     def get_method_name(prefix, tag):
         method_name = f'{prefix}__{tag}'.replace('-', '_')
         return re.sub(r'[^a-zA-Z0-9_]', '__', method_name)
 
+    def flush(self):
+        """Write the current paragraph, one row per format."""
+        for text, fmt in self.runs:
+            if self.preformatted:
+                text = text.replace(LINE_BREAK, '\n').strip('\n')
+                if not text.strip():
+                    continue
+            else:
+                text = '\n'.join(' '.join(line.split()) for line in text.split(LINE_BREAK)).strip()
+            if text:
+                self.monitor.write_string(text, font=fmt)
+        self.runs = []
+
+    def close(self):
+        super().close()
+        self.flush()
+
+    def parse(self, content, chunk_size=FEED_CHUNK_SIZE):
+        """
+        Parse `content` a chunk at a time, yielding after each one
+        (whatever was complete by then is already in the monitor).
+        """
+        for index in range(0, len(content), chunk_size):
+            self.feed(content[index:index + chunk_size])
+            yield index
+        self.close()
+
     def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS or self.debug:
+            self.flush()
+        if tag in PREFORMATTED_TAGS:
+            self.preformatted += 1
+
         self.attrs = dict(attrs)
         method_name = self.get_method_name('start_tag', tag)
         if self.debug:
@@ -40,6 +94,11 @@ class BaseParser(HTMLParser):
         self.format_stack.append(fmt)
 
     def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS or self.debug:
+            self.flush()
+        if tag in PREFORMATTED_TAGS and self.preformatted:
+            self.preformatted -= 1
+
         method_name = self.get_method_name('end_tag', tag)
         if self.debug:
             self.monitor.write_fixed(f'{method_name}')
@@ -58,8 +117,14 @@ class BaseParser(HTMLParser):
         if fmt is None:
             return
 
+        self.add_text(data, fmt)
+
+    def add_text(self, data, fmt):
         if isinstance(fmt, (tuple, list)):
-            self.monitor.write_string(data, font=fmt)
+            if self.runs and self.runs[-1][1] == fmt:
+                self.runs[-1][0] += data
+            else:
+                self.runs.append([data, fmt])
             return
 
         if getattr(fmt, '__call__', None) is not None:
@@ -80,6 +145,12 @@ class Parser(BaseParser):
     def start_tag__h3(self):
         return (HEADER_FONT, SIZE + 4)
 
+    def start_tag__br(self):
+        fmt = self.format_stack[-1]
+        if isinstance(fmt, (tuple, list)):
+            self.add_text(LINE_BREAK, fmt)
+        return fmt
+
     def end_tag__hr(self):
         self.monitor.hr()
 
@@ -107,18 +178,34 @@ class Parser(BaseParser):
         for tr in table:
             row = []
             for cell_type, *cells in tr:
+                text = ' '.join(' '.join(cells).split())
                 if cell_type == 'header':
-                    headers.append(' '.join(cells))
+                    headers.append(text)
                 else:
-                    row.append(' '.join(cells))
+                    row.append(text)
 
             if row:
                 rows.append(row)
 
+        # Every row gets as many cells as the widest one:
+        width = max([len(headers)] + [len(row) for row in rows])
+        if not width:
+            return
+        headers += [''] * (width - len(headers))
+        rows = [row + [''] * (width - len(row)) for row in rows]
+
+        # The slot takes its place among the rows right now (add_slot
+        # waits for the main loop), before whatever follows the table:
         slot = self.monitor.add_slot()
+        self.render_table(slot, headers, rows)
+
+    @ui_operation
+    def render_table(self, slot, headers, rows):
+        # The whole table is collected before getting here,
+        # so it's created and rendered in one go.
         indexes = [[x] for x in range(0, len(headers))]
 
-        widget = Table(slot, indexes, headers)
+        widget = Table(slot, indexes, headers, wrap=True)
         widget.render(rows)
 
     def start_tag__tr(self):
@@ -0,0 +1,89 @@
+from os import environ
+from pathlib import PosixPath
+import sqlite3
+import threading
+
+
+class TreeStore:
+    """
+    Local copy of the spaces and pages trees of Confluence wikis.
+
+    Everything is keyed by the wiki URL and the space key. Each space
+    carries the fingerprint of the pages listing it was saved from,
+    so a sync only rewrites the spaces that changed since then.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or (PosixPath(environ['HOME']) / '.cache' / 'fxi' / 'confluence.sqlite3')
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS spaces ('
+                ' wiki TEXT, key TEXT, name TEXT, type TEXT, url TEXT, fingerprint TEXT,'
+                ' PRIMARY KEY (wiki, key))'
+            )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                ' wiki TEXT, space TEXT, position INTEGER,'
+                ' id TEXT, parent_id TEXT, title TEXT, url TEXT,'
+                ' PRIMARY KEY (wiki, space, position))'
+            )
+
+    def load(self, wiki):
+        """Every space of `wiki`, with its pages in listing order."""
+        with self.lock:
+            spaces_rows = self.db.execute(
+                'SELECT key, name, type, url, fingerprint FROM spaces WHERE wiki = ? ORDER BY key',
+                (wiki,)
+            ).fetchall()
+            pages_rows = self.db.execute(
+                'SELECT space, id, parent_id, title, url FROM pages WHERE wiki = ? ORDER BY space, position',
+                (wiki,)
+            ).fetchall()
+
+        spaces = {}
+        for key, name, the_type, url, fingerprint in spaces_rows:
+            spaces[key] = {
+                'key': key,
+                'name': name,
+                'type': the_type,
+                'url': url,
+                'fingerprint': fingerprint,
+                'pages': [],
+            }
+
+        for space, page_id, parent_id, title, url in pages_rows:
+            if space in spaces:
+                spaces[space]['pages'].append({
+                    'id': page_id,
+                    'parentId': parent_id,
+                    'title': title,
+                    'url': url,
+                    'space': space,
+                })
+        return spaces
+
+    def save_space(self, wiki, space, pages, fingerprint):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO spaces VALUES (?, ?, ?, ?, ?, ?)',
+                (wiki, space['key'], space['name'], space['type'], space['url'], fingerprint)
+            )
+            self.db.execute('DELETE FROM pages WHERE wiki = ? AND space = ?', (wiki, space['key']))
+            self.db.executemany(
+                'INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (wiki, space['key'], position, page['id'], page['parentId'], page['title'], page.get('url'))
+                    for position, page in enumerate(pages)
+                )
+            )
+
+    def delete_space(self, wiki, key):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM spaces WHERE wiki = ? AND key = ?', (wiki, key))
+            self.db.execute('DELETE FROM pages WHERE wiki = ? AND space = ?', (wiki, key))
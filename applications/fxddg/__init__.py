@@ -30,7 +30,7 @@ class App(AppBase):
         image = getattr(q, 'image', None)
         if image:
             slot = monitor.add_slot()
-            self.enqueue(self.show_cover, slot, image)
+            monitor.enqueue(self.show_cover, slot, image)
 
         heading = getattr(q, 'heading', None)
         if heading:
@@ -24,7 +24,7 @@ class App(AppBase):
         cover_thumbnail_url = movie.get('cover url')
         if cover_thumbnail_url:
             slot = frame_slot.add_slot()
-            self.enqueue(self.download_cover, slot, cover_thumbnail_url)
+            frame_slot.enqueue(self.download_cover, slot, cover_thumbnail_url)
 
         cast = [person.get('name') for person in movie.get('cast', [])[0:7]]
         frame_slot.write(', '.join(cast), 1)
@@ -54,6 +54,6 @@ class App(AppBase):
             monitor.write(f'{kind}: {title} ({year})')
 
             frame_slot = monitor.add_frame_slot()
-            self.enqueue(self.download_more_info_about_movie, frame_slot, movie_info)
+            monitor.enqueue(self.download_more_info_about_movie, frame_slot, movie_info)
 
             monitor.hr()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0x245000d
+# __coconut_hash__ = 0xf700ab11
 
 # Compiled with Coconut version 1.4.0 [Ernest Scribbler]
 
@@ -588,7 +588,7 @@ class MySlideShow(ImageSlideShow):
     def on_next(self, *args, **kwargs):
         num_slides = len(self.slides)
         if not self.full and num_slides > 5 and self.index > (num_slides - 4):
-            self.app.enqueue(self.app.load_next_page)
+            self.prefetch(self.app.load_next_page)
 
     def create_slide(self, item):
         img = (item('img')).eq(0)
@@ -679,7 +679,7 @@ class App(HTTPMixin, AppBase):
                 monitor.h2(f'{index:>3}: {name}')
 
             slot = monitor.add_slot()
-            self.enqueue(slot.write_image_from_url, thumbnail_url)
+            monitor.enqueue(slot.write_image_from_url, thumbnail_url)
 
             monitor.write(nick)
             monitor.hr()
@@ -758,17 +758,17 @@ class App(HTTPMixin, AppBase):
         with self.info('Creating slides...'):
             (tuple)(map(self.slideshow.create_slide, (html('div.grid-item')).items()))
 
-        self.enqueue(self.do_render_slideshow)
+        self.slideshow.enqueue(self.do_render_slideshow)
         self.slideshow.render()
 
     def do_render_slideshow(self):
         if len(self.slideshow.slides) == 0 or self.slideshow.slides[0].image_reference is None:
             sleep(0.5)
-            self.enqueue(self.do_render_slideshow)
+            self.slideshow.enqueue(self.do_render_slideshow)
             return
 
         self.slideshow.refresh()
-        self.enqueue(self.load_next_page)
+        self.slideshow.prefetch(self.load_next_page)
 
     def cmd__lnp(self):
         """
@@ -810,7 +810,7 @@ class App(HTTPMixin, AppBase):
         self.last_image = img_id
 
         slot = monitor.add_slot()
-        self.enqueue(slot.write_image_from_url, img.attr('src'))
+        monitor.enqueue(slot.write_image_from_url, img.attr('src'))
 
         (monitor.write)(((item('span.created_time')).eq(0)).text())
 
@@ -1,74 +1,146 @@
+import threading
+
 from fxi.apps import AppBase
 from fxi.table import Table
 
-import easyimap
+from .imap import Mailbox, MailboxListener
+from .store import MailStore
 
 
 class App(AppBase):
     title = 'E-mail'
 
     def init(self):
-        self.client = None
+        self.mailbox = None
+        self.listener = None
         self.username = None
         self.messages = {}
+        # `sync`, `sync_expunged` and commands may run at the same time:
+        self.lock = threading.RLock()
+        self.store = MailStore()
+        self.key = None
+        self.uidvalidity = None
         self.main_list = Table(
-            self,
+            self.tab.interior,
             (('from',), ('subject',), ('date',)),
             ('From', 'Subject', 'When')
         )
 
         self.info('Open a new mailbox using: open <host> <username>')
 
+    def quit(self):
+        if self.listener:
+            self.listener.stop()
+        if self.mailbox:
+            self.mailbox.logout()
+        super().quit()
+
     def cmd__open(self, host, username):
         """
         Open an IMAP mailbox.
 
-        Usage: open <host> <username>
+        Usage: open <host[:port]> <username>
 
         Examples:
             open imap.example.org john.doe
             open gmail john.dough
+            open localhost:1143 john.doe
         """
-        if '.' not in host:
+        host, _, port = host.partition(':')
+        if '.' not in host and host != 'localhost':
             host = f'imap.{host}.com'
 
+        # Show what we already have while connecting:
+        self.key = (host, username, 'INBOX')
+        self.uidvalidity, highest_uid = self.store.get_state(self.key)
+        with self.lock:
+            self.messages = {
+                message['uid']: message
+                for message in self.store.load(self.key, self.uidvalidity)
+            }
+        self.render()
+
         password = self.ask(f'Password for {username}', hidden=True)
-        self.client = easyimap.connect(host, username, password)
+
+        def connect():
+            return Mailbox(
+                host,
+                username,
+                password,
+                port=int(port) if port else None,
+                use_ssl=self.get_config('ssl', True)
+            )
+
+        self.mailbox = connect()
+        self.mailbox.uidvalidity = self.uidvalidity
+        self.mailbox.highest_uid = highest_uid
         self.info('Client connected')
         self.username = username
-        self.enqueue(self.reload)
-
-    def reload(self, max_messages=5):
+        self.enqueue_background(self.sync)
+
+        if self.listener:
+            self.listener.stop()
+        self.listener = MailboxListener(connect(), self.on_mailbox_change)
+        self.new_thread(self.listen, (self.listener,))
+
+    def listen(self, listener):
+        # Runs in a thread of its own, for as long as the mailbox is open.
+        try:
+            listener.run()
+        except Exception as ex:
+            the_type = type(ex)
+            self.info(f'{the_type}: {ex}')
+
+    def on_mailbox_change(self, events):
+        if 'expunge' in events:
+            self.enqueue(self.sync_expunged)
+        if 'exists' in events:
+            self.enqueue(self.sync)
+
+    def sync(self):
+        """Fetch the headers of new messages (only)."""
         self.info('Loading messages...')
-        for message in self.client.listup(max_messages):
-            self.add_message(message)
+        with self.lock:
+            messages, reset = self.mailbox.sync(int(self.get_config('max_messages', 200)))
+            self.uidvalidity = self.mailbox.uidvalidity
+            self.store.save(self.key, self.uidvalidity, self.mailbox.highest_uid, messages, reset)
+
+            if reset:
+                self.messages = {}
+            for message in messages:
+                self.messages[message['uid']] = message
         self.info()
-        self.main_list.clear()
-        self.main_list.render(self.messages)
-        self.enqueue(self.reload_and_refresh)
-
-    def reload_and_refresh(self, max_messages=80):
-        self.info('Loading more messages...')
-        for message in self.client.listup(max_messages):
-            self.add_message(message)
-        self.info()
-        self.main_list.render(self.messages)
 
-    def add_message(self, message):
-        self.messages[message.uid] = {
-            'object': message,
-            'subject': f'{message.title}'.encode('utf-8'),
-            'from': message.from_addr,
-            'to': message.to,
-            'date': message.date
-        }
+        if messages or reset:
+            self.render()
+
+    def sync_expunged(self):
+        """Forget messages that were removed from the server."""
+        with self.lock:
+            if not self.messages:
+                return
+
+            uids = self.mailbox.list_uids(min(self.messages))
+            removed = [uid for uid in self.messages if uid not in uids]
+            for uid in removed:
+                self.store.delete(self.key, self.uidvalidity, uid)
+                del self.messages[uid]
+
+        if removed:
+            self.render()
 
     def refresh(self):
-        self.enqueue(self.reload)
-        self.main_list.render(self.messages)
+        if self.mailbox:
+            self.enqueue_background(self.sync)
 
     def render(self):
-        self.main_list.render(self.messages)
+        with self.lock:
+            messages = list(self.messages.values())
+        self.render_messages(messages)
+
+    def render_messages(self, messages):
+        # Newest first:
+        self.main_list.render(sorted(messages, key=lambda message: message['uid'], reverse=True))
 
     def cmd__r(self, index):
         """
@@ -78,26 +150,61 @@ class App(AppBase):
         """
 
         entry = self.main_list.entries[int(index)]
-        obj = entry.data['object']
-
-        monitor = self.open_monitor(entry['subject'])
-        for line in obj.body.split('\n'):
+        data = entry.data
+
+        if 'body' not in data:
+            body = self.store.get_body(self.key, self.uidvalidity, data['uid'])
+            if body is None:
+                with self.info(f'Loading "{data["subject"]}"...'):
+                    body = self.mailbox.fetch_body(data['uid'])
+                self.store.save_body(self.key, self.uidvalidity, data['uid'], body)
+            data['body'] = body
+
+        monitor = self.open_monitor(data['subject'], text_mode=True)
+        monitor.write(f'From: {data["from"]}')
+        monitor.write(f'To: {data["to"]}')
+        monitor.write(f'Date: {data["date"]}')
+        # The list shows only the beginning of long subjects:
+        monitor.write(f'Subject: {data["subject"]}')
+        monitor.hr()
+        for line in data['body'].split('\n'):
             monitor.write(line)
 
     def cmd__delete(self, index):
         """
         Delete <index> message
-        (Not working right now, I believe)
 
         Usage: delete <index>
         """
 
         entry = self.main_list.entries[int(index)]
-        obj = entry.data['object']
+        data = entry.data
 
-        self.info(f'Marking "{obj.title}" as Deleted...')
-        self.client._mailer.store(f'{obj.uid}', '+FLAGS', '\\Deleted')
-        self.info('Expunge...')
-        self.client._mailer.expunge()
+        self.info(f'Deleting "{data["subject"]}"...')
+        self.mailbox.delete(data['uid'])
+        with self.lock:
+            self.store.delete(self.key, self.uidvalidity, data['uid'])
+            self.messages.pop(data['uid'], None)
         self.info('Message deleted!')
-        self.enqueue(self.reload)
+        self.render()
+
+    def cmd__search(self, *terms):
+        """
+        Show only messages containing all <terms> in their
+        subject, sender or (already read) body.
+        Without terms, every message is shown again.
+
+        Usage: search <terms>
+        """
+
+        if self.key is None:
+            self.info('Open a mailbox first.')
+            return
+
+        if not terms:
+            self.render()
+            return
+
+        messages = self.store.search(self.key, self.uidvalidity, ' '.join(terms))
+        self.info(f'{len(messages)} messages found.')
+        self.render_messages(messages)
@@ -0,0 +1,278 @@
+from email import policy
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+import imaplib
+import re
+import select
+import threading
+import time
+
+
+HEADER_FIELDS = 'FROM TO SUBJECT DATE'
+FETCH_CHUNK_SIZE = 500
+
+FETCH_RESPONSE_REGEX = re.compile(rb'UID (\d+)|FLAGS \(([^)]*)\)')
+
+# Servers may drop IDLE connections after 30 minutes (RFC 2177):
+IDLE_TIMEOUT = 29 * 60
+NOOP_INTERVAL = 30
+
+
+class IMAPError(Exception):
+    pass
+
+
+def check(response):
+    typ, data = response
+    if typ != 'OK':
+        raise IMAPError(f'{typ}: {data}')
+    return data
+
+
+def parse_date(value):
+    try:
+        return parsedate_to_datetime(value).strftime('%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return value or ''
+
+
+def parse_headers(uid, flags, headers_bytes):
+    headers = BytesParser(policy=policy.default).parsebytes(headers_bytes, headersonly=True)
+    return {
+        'uid': uid,
+        'flags': flags,
+        'from': f"{headers['from'] or ''}",
+        'to': f"{headers['to'] or ''}",
+        'subject': f"{headers['subject'] or ''}",
+        'date': parse_date(headers['date']),
+    }
+
+
+def get_text(message):
+    part = message.get_body(preferencelist=('plain', 'html'))
+    if part is None:
+        return ''
+    return part.get_content()
+
+
+class Mailbox:
+    """
+    One IMAP mailbox, synced incrementally.
+
+    Only UIDs, flags and a few header fields are downloaded for the
+    messages list. We remember UIDVALIDITY and the highest UID seen,
+    so each sync asks only for messages that arrived since the last
+    one (everything is fetched again only if UIDVALIDITY changes).
+    """
+
+    def __init__(self, host, username, password, port=None, use_ssl=True, name='INBOX'):
+        self.host = host
+        self.username = username
+        self.name = name
+
+        self.lock = threading.Lock()
+        if use_ssl:
+            self.connection = imaplib.IMAP4_SSL(host, port or imaplib.IMAP4_SSL_PORT)
+        else:
+            self.connection = imaplib.IMAP4(host, port or imaplib.IMAP4_PORT)
+        check(self.connection.login(username, password))
+
+        self.uidvalidity = None
+        self.highest_uid = 0
+        self.select()
+
+    def select(self):
+        check(self.connection.select(self.name))
+        _, data = self.connection.response('UIDVALIDITY')
+        return int(data[0])
+
+    def sync(self, initial_count=200):
+        """
+        Return the headers of the new messages and whether
+        everything known before must be forgotten.
+        """
+        with self.lock:
+            uidvalidity = self.select()
+            reset = uidvalidity != self.uidvalidity
+            if reset:
+                self.uidvalidity = uidvalidity
+                self.highest_uid = 0
+
+            data = check(self.connection.uid('SEARCH', None, f'UID {self.highest_uid + 1}:*'))
+            # "n:*" always includes the last message, even when its UID is below n:
+            uids = [uid for uid in map(int, data[0].split()) if uid > self.highest_uid]
+            if reset:
+                uids = uids[-initial_count:]
+
+            messages = self.fetch_headers(uids)
+            if uids:
+                self.highest_uid = max(uids)
+            return messages, reset
+
+    def fetch_headers(self, uids):
+        # Must be called with `self.lock` held.
+        messages = []
+        for index in range(0, len(uids), FETCH_CHUNK_SIZE):
+            uids_set = ','.join(f'{uid}' for uid in uids[index:index + FETCH_CHUNK_SIZE])
+            data = check(self.connection.uid(
+                'FETCH',
+                uids_set,
+                f'(UID FLAGS BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])'
+            ))
+
+            for item in data:
+                if not isinstance(item, tuple):
+                    continue
+
+                uid = None
+                flags = ''
+                for uid_match, flags_match in FETCH_RESPONSE_REGEX.findall(item[0]):
+                    if uid_match:
+                        uid = int(uid_match)
+                    else:
+                        flags = flags_match.decode('utf-8')
+
+                if uid is not None:
+                    messages.append(parse_headers(uid, flags, item[1]))
+        return messages
+
+    def list_uids(self, lowest_uid):
+        """Every UID from `lowest_uid` on."""
+        with self.lock:
+            data = check(self.connection.uid('SEARCH', None, f'UID {lowest_uid}:*'))
+        return {uid for uid in map(int, data[0].split()) if uid >= lowest_uid}
+
+    def fetch_body(self, uid):
+        with self.lock:
+            data = check(self.connection.uid('FETCH', f'{uid}', '(BODY.PEEK[])'))
+
+        for item in data:
+            if isinstance(item, tuple):
+                message = BytesParser(policy=policy.default).parsebytes(item[1])
+                return get_text(message)
+        return ''
+
+    def delete(self, uid):
+        with self.lock:
+            check(self.connection.uid('STORE', f'{uid}', '+FLAGS', '(\\Deleted)'))
+            check(self.connection.expunge())
+
+    def logout(self):
+        with self.lock:
+            try:
+                self.connection.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+
+class MailboxListener:
+    """
+    Waits for changes in a mailbox, on a connection of its own.
+
+    Uses IDLE when the server supports it (changes arrive in a second
+    or so) and NOOP every `NOOP_INTERVAL` seconds otherwise. Calls
+    `on_change(events)`, `events` being a set with "exists" (new
+    messages) and/or "expunge" (removed messages).
+    """
+
+    def __init__(self, mailbox, on_change):
+        self.mailbox = mailbox
+        self.connection = mailbox.connection
+        self.on_change = on_change
+        self.alive = True
+        self.buffer = b''
+
+    def stop(self):
+        self.alive = False
+
+    def run(self):
+        try:
+            if 'IDLE' in self.connection.capabilities:
+                while self.alive:
+                    self.idle()
+            else:
+                while self.alive:
+                    self.poll()
+        finally:
+            self.mailbox.logout()
+
+    def idle(self):
+        tag = self.connection._new_tag()
+        self.connection.send(tag + b' IDLE\r\n')
+
+        line = self.read_line(timeout=30)
+        if line is None or not line.startswith(b'+'):
+            raise IMAPError(f'IDLE refused: {line}')
+
+        events = set()
+        deadline = time.monotonic() + IDLE_TIMEOUT
+        while self.alive and not events and time.monotonic() < deadline:
+            line = self.read_line(timeout=1)
+            if line is not None:
+                events |= self.parse_event(line)
+
+        self.connection.send(b'DONE\r\n')
+        while True:
+            line = self.read_line(timeout=30)
+            if line is None:
+                raise IMAPError('No answer to DONE')
+            if line.startswith(tag):
+                break
+            events |= self.parse_event(line)
+
+        if events:
+            self.on_change(events)
+
+    def poll(self):
+        for _ in range(NOOP_INTERVAL):
+            if not self.alive:
+                return
+            time.sleep(1)
+
+        with self.mailbox.lock:
+            check(self.connection.noop())
+            events = set()
+            for name in ('EXISTS', 'EXPUNGE'):
+                _, data = self.connection.response(name)
+                if data and data[0] is not None:
+                    events.add(name.lower())
+
+        if events:
+            self.on_change(events)
+
+    @staticmethod
+    def parse_event(line):
+        parts = line.split()
+        if len(parts) >= 3 and parts[0] == b'*':
+            name = parts[2].upper()
+            if name == b'EXISTS':
+                return {'exists'}
+            if name == b'EXPUNGE':
+                return {'expunge'}
+        return set()
+
+    def read_line(self, timeout):
+        """
+        Read a line straight from the socket, waiting up to `timeout`
+        seconds for it (imaplib itself can only block forever).
+        """
+        sock = self.connection.sock
+        deadline = time.monotonic() + timeout
+
+        while b'\r\n' not in self.buffer:
+            pending = getattr(sock, 'pending', lambda: 0)()
+            if not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                ready, _, _ = select.select([sock], [], [], remaining)
+                if not ready:
+                    return None
+
+            data = sock.recv(4096)
+            if not data:
+                raise IMAPError('Connection closed by the server')
+            self.buffer += data
+
+        line, self.buffer = self.buffer.split(b'\r\n', 1)
+        return line
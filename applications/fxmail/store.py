@@ -0,0 +1,156 @@
+from os import environ
+from pathlib import PosixPath
+import sqlite3
+import threading
+
+
+MESSAGE_COLUMNS = ('uid', 'flags', 'from', 'to', 'subject', 'date')
+
+
+def quote_terms(terms):
+    """Turn free text into a FTS5 query matching every word."""
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms.split())
+
+
+class MailStore:
+    """
+    Local copy of the messages headers (and of the bodies already read).
+
+    Messages are keyed by (host, username, mailbox, uidvalidity, uid),
+    the first three being passed around as `key`. The sync state of
+    each mailbox is kept too, so opening a mailbox again only asks the
+    server for what's new. Subjects, senders and bodies are indexed
+    with FTS5 for `search`.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or (PosixPath(environ['HOME']) / '.cache' / 'fxi' / 'mail.sqlite3')
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS mailboxes ('
+                ' host TEXT, username TEXT, mailbox TEXT,'
+                ' uidvalidity INTEGER, highest_uid INTEGER,'
+                ' PRIMARY KEY (host, username, mailbox))'
+            )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                ' host TEXT, username TEXT, mailbox TEXT, uidvalidity INTEGER, uid INTEGER,'
+                ' flags TEXT, sender TEXT, recipient TEXT, subject TEXT, date TEXT, body TEXT,'
+                ' UNIQUE (host, username, mailbox, uidvalidity, uid))'
+            )
+            self.db.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS messages_index USING fts5('
+                ' subject, sender, body, content=messages, content_rowid=rowid)'
+            )
+            self.db.execute(
+                'CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN'
+                ' INSERT INTO messages_index (rowid, subject, sender, body)'
+                ' VALUES (new.rowid, new.subject, new.sender, new.body);'
+                ' END'
+            )
+            self.db.execute(
+                'CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN'
+                ' INSERT INTO messages_index (messages_index, rowid, subject, sender, body)'
+                ' VALUES (\'delete\', old.rowid, old.subject, old.sender, old.body);'
+                ' END'
+            )
+            self.db.execute(
+                'CREATE TRIGGER IF NOT EXISTS messages_update AFTER UPDATE ON messages BEGIN'
+                ' INSERT INTO messages_index (messages_index, rowid, subject, sender, body)'
+                ' VALUES (\'delete\', old.rowid, old.subject, old.sender, old.body);'
+                ' INSERT INTO messages_index (rowid, subject, sender, body)'
+                ' VALUES (new.rowid, new.subject, new.sender, new.body);'
+                ' END'
+            )
+
+    def get_state(self, key):
+        """The (uidvalidity, highest_uid) of the last sync, or (None, 0)."""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT uidvalidity, highest_uid FROM mailboxes'
+                ' WHERE host = ? AND username = ? AND mailbox = ?',
+                key
+            ).fetchone()
+        return row or (None, 0)
+
+    def load(self, key, uidvalidity):
+        return self.select(
+            'WHERE host = ? AND username = ? AND mailbox = ? AND uidvalidity = ?',
+            key + (uidvalidity,)
+        )
+
+    def search(self, key, uidvalidity, terms):
+        return self.select(
+            'WHERE host = ? AND username = ? AND mailbox = ? AND uidvalidity = ?'
+            ' AND rowid IN (SELECT rowid FROM messages_index WHERE messages_index MATCH ?)',
+            key + (uidvalidity, quote_terms(terms))
+        )
+
+    def select(self, where, parameters):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT uid, flags, sender, recipient, subject, date FROM messages '
+                f'{where} ORDER BY uid',
+                parameters
+            ).fetchall()
+        return [dict(zip(MESSAGE_COLUMNS, row)) for row in rows]
+
+    def save(self, key, uidvalidity, highest_uid, messages, reset):
+        with self.lock, self.db:
+            if reset:
+                self.db.execute(
+                    'DELETE FROM messages WHERE host = ? AND username = ? AND mailbox = ?',
+                    key
+                )
+
+            # An upsert (not "INSERT OR REPLACE") so the index triggers run:
+            self.db.executemany(
+                'INSERT INTO messages'
+                ' (host, username, mailbox, uidvalidity, uid, flags, sender, recipient, subject, date)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (host, username, mailbox, uidvalidity, uid) DO UPDATE SET'
+                ' flags = excluded.flags, sender = excluded.sender, recipient = excluded.recipient,'
+                ' subject = excluded.subject, date = excluded.date',
+                (
+                    key + (
+                        uidvalidity, message['uid'], message['flags'],
+                        message['from'], message['to'], message['subject'], message['date']
+                    )
+                    for message in messages
+                )
+            )
+            self.db.execute(
+                'INSERT OR REPLACE INTO mailboxes VALUES (?, ?, ?, ?, ?)',
+                key + (uidvalidity, highest_uid)
+            )
+
+    def get_body(self, key, uidvalidity, uid):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body FROM messages WHERE host = ? AND username = ?'
+                ' AND mailbox = ? AND uidvalidity = ? AND uid = ?',
+                key + (uidvalidity, uid)
+            ).fetchone()
+        return row and row[0]
+
+    def save_body(self, key, uidvalidity, uid, body):
+        with self.lock, self.db:
+            self.db.execute(
+                'UPDATE messages SET body = ? WHERE host = ? AND username = ?'
+                ' AND mailbox = ? AND uidvalidity = ? AND uid = ?',
+                (body,) + key + (uidvalidity, uid)
+            )
+
+    def delete(self, key, uidvalidity, uid):
+        with self.lock, self.db:
+            self.db.execute(
+                'DELETE FROM messages WHERE host = ? AND username = ?'
+                ' AND mailbox = ? AND uidvalidity = ? AND uid = ?',
+                key + (uidvalidity, uid)
+            )
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0xd312e5ea
+# __coconut_hash__ = 0xbe84b171
 
 # Compiled with Coconut version 1.3.1 [Dead Parrot]
 
@@ -521,9 +521,9 @@ import subprocess
 from urllib.parse import quote_plus as urlquote
 from urllib.parse import urljoin
 
+from fxi import http_client
 from fxi.apps import AppBase
 
-import requests
 from bs4 import BeautifulSoup
 
 
@@ -543,7 +543,7 @@ class App(AppBase):
 
     @staticmethod
     def get(url, **kwargs):
-        response = requests.get(url, **kwargs)
+        response = http_client.get(url, **kwargs)
         response.raise_for_status()
         return response.content
 
@@ -713,10 +713,12 @@ class App(AppBase):
             _coconut_match_check = False
         if _coconut_match_check:
             viewer = self.view_lyrics
+            text_mode = True
         if not _coconut_match_check:
             viewer = self.view_band
+            text_mode = False
 
-        monitor = self.open_monitor(text)
+        monitor = self.open_monitor(text, text_mode=text_mode)
         return _coconut_tail_call(viewer, text, url, monitor, soup)
 
     def view_band(self, text, url, monitor, soup):
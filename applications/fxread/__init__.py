@@ -45,7 +45,7 @@ class App(AppBase):
         self.info()
 
         self.current_title = a.title
-        monitor = self.open_monitor(f'{a.title}')
+        monitor = self.open_monitor(f'{a.title}', text_mode=True)
 
         if a.authors:
             authors = ', '.join(a.authors)
@@ -61,7 +61,7 @@ class App(AppBase):
         start = page_index * self.page_size
         end = (start + self.page_size) + 50
 
-        self.enqueue(self.current_monitor.clear)
+        self.current_monitor.clear()
         self.current_monitor.h2(f'Page {self.current_page} of {self.current_page_counter}')
 
         for line in self.current_content[start:end]:
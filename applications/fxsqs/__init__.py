@@ -1,18 +1,21 @@
 import json
 
 import boto3
+from botocore.config import Config
 
 from fxi.apps import AppBase
+from fxi.dispatcher import post
 from fxi.table import Table
 
 from .operations import SQSOperationsMixin
+from .watcher import QueuesWatcher
 
 
 def arg_is_entry(method):
     def new_method(self, *args, **kwargs):
         entry_index = int(args[0])
         entry = self.main_list.entries[entry_index]
-        return method(self, entry)
+        return method(self, entry, *args[1:], **kwargs)
 
     new_method.__doc__ = method.__doc__
     return new_method
@@ -24,31 +27,55 @@ class MyTable(Table):
         self.app = app
 
     def refresh(self):
+        # Every queue is reloaded in its own task (see `App.max_workers`)
+        # and each row is updated as soon as its response arrives.
         for entry in self.entries:
             entry.mark_as('loading')
-            name = entry.data['name']
-            new_data = self.app.refresh_queue(name)
-            entry.refresh(new_data)
+            self.app.enqueue(self.refresh_entry, entry)
+
+    def refresh_entry(self, entry):
+        name = entry.data['name']
+        new_data = self.app.refresh_queue(name)
+        entry.refresh(new_data)
 
 
 class App(SQSOperationsMixin, AppBase):
     title = "SQS"
 
+    @property
+    def max_workers(self):
+        return int(self.get_config('parallelism', 16))
+
     def init(self, *args, **kwargs):
-        self.client = boto3.resource('sqs', 'us-east-1')  # XXX
+        self.client = boto3.resource(
+            'sqs',
+            region_name=self.get_config('region', 'us-east-1'),
+            endpoint_url=self.get_config('endpoint_url'),
+            config=Config(max_pool_connections=self.max_workers)
+        )
         self.queues = {}
         self.queues_widgets = {}
         self.main_list = MyTable(
             self,
             self.tab.interior,
-            (('name',), ('count',), ('in_transit_count',)),
-            ('Name', 'Messages', 'In transit')
+            (('name',), ('count',), ('in_transit_count',), ('net_rate',)),
+            ('Name', 'Messages', 'In transit', 'Net/s')
         )
+        self.watcher = QueuesWatcher(self)
 
     def load_queues_list(self):
+        # Only the names, for now: attributes are loaded by `refresh`.
         self.info('Loading queues list...')
         for queue in self.client.queues.all():
-            self.add_queue(queue)
+            name = queue.url.rsplit('/', 1)[-1]
+            self.queues[name] = {
+                'object': queue,
+                'arn': None,
+                'name': name,
+                'count': '',
+                'in_transit_count': '',
+                'net_rate': '',
+            }
         self.info()
 
     def refresh_queue(self, name):
@@ -60,12 +87,14 @@ class App(SQSOperationsMixin, AppBase):
     def add_queue(self, obj):
         arn = obj.attributes['QueueArn']
         name = arn.split(':')[-1]
+        old_entry = self.queues.get(name, {})
         entry = {
             'object': obj,
             'arn': arn,
             'name': name,
             'count': int(obj.attributes['ApproximateNumberOfMessages']),
             'in_transit_count': int(obj.attributes['ApproximateNumberOfMessagesNotVisible']),
+            'net_rate': old_entry.get('net_rate', ''),
         }
         self.queues[name] = entry
         return entry
@@ -80,11 +109,31 @@ class App(SQSOperationsMixin, AppBase):
     def initial_render(self):
         self.load_queues_list()
         self.main_list.render(self.queues)
+        # `render` only posts the rows to the main loop: refresh
+        # after them, or there would be no entries to refresh yet.
+        post(self.main_list.refresh)
 
     def render(self):
         self.enqueue(self.initial_render)
 
     # COMMANDS:
+    def cmd__watch(self, state='on'):
+        """
+        Keep the queues list up to date, polling each queue
+        more often while its counts are changing.
+        Also shows how many messages/second the queues grow
+        (or shrink, if negative) by.
+
+        Usage: watch <on|off>
+        """
+
+        if state == 'off':
+            self.watcher.stop()
+            self.info('Stopped watching queues.')
+        else:
+            self.watcher.start()
+            self.info('Watching queues...')
+
     @arg_is_entry
     def cmd__p(self, entry):
         """
@@ -110,31 +159,31 @@ class App(SQSOperationsMixin, AppBase):
         monitor.write(f'{obj.attributes}')
 
     @arg_is_entry
-    def cmd__vm(self, entry):
+    def cmd__vm(self, entry, limit=50, mode=None):
         """
-        View messages from <index> queue
+        View up to <limit> messages from <index> queue.
+        With "sample", messages are picked along the time they
+        were sent instead of just the first ones received.
         BEWARE: it will, in fact, generate one more
-        "rejection" for each message, so use it wisely.
-
-        Usage: vm <index>
+        "rejection" for each message received, so use it wisely.
 
-        No messages limit implemented, yet.
+        Usage: vm <index> <limit=50> [sample]
         """
-        self.view_messages(entry.data['object'])
+        self.view_messages(entry.data['object'], int(limit), mode == 'sample')
 
     @arg_is_entry
-    def cmd__recover(self, entry):
+    def cmd__recover(self, entry, limit=50):
         """
         Recover messages from a dead letter queue.
         It will find the corresponding "alive" queue
         automatically for you.
 
-        Usage: recover <index>
+        Usage: recover <index> <limit=50>
         """
 
         entry.mark_as('O')
-        arn = entry.data['arn']
         obj = entry.data['object']
+        arn = obj.attributes['QueueArn']
         for other_entry in self.main_list.entries:
             if other_entry is entry:
                 continue
@@ -150,7 +199,7 @@ class App(SQSOperationsMixin, AppBase):
             return
 
         other_entry.mark_as('D')
-        count = self.move_messages(obj, other_obj)
+        count = self.move_messages(obj, other_obj, int(limit))
         self.info(f'{count} messages moved successfuly!')
 
         entry.refresh()
@@ -171,7 +220,7 @@ class App(SQSOperationsMixin, AppBase):
         obj_a = entry_a.data['object']
         obj_b = entry_b.data['object']
 
-        count = self.move_messages(obj_a, obj_b)
+        count = self.move_messages(obj_a, obj_b, int(num_messages))
         self.info(f'{count} messages moved successfuly!')
 
         entry_a.refresh()
@@ -1,3 +1,31 @@
+from datetime import datetime
+import random
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+
+# SQS limit for batch operations:
+MAX_BATCH_SIZE = 10
+
+MAX_ATTEMPTS = 3
+
+# Errors about the whole batch request:
+THROTTLING_ERRORS = {'Throttling', 'ThrottlingException', 'RequestThrottled'}
+TOO_LONG_ERRORS = {'BatchRequestTooLong', 'AWS.SimpleQueueService.BatchRequestTooLong'}
+
+# Viewing messages:
+MAX_VIEW_MESSAGES = 500
+SAMPLE_POOL_FACTOR = 4
+VIEW_WAIT_TIME = 2
+VIEW_VISIBILITY_TIMEOUT = 5
+# Batches with only already seen messages before giving up:
+MAX_DUPLICATE_BATCHES = 3
+PAGE_SIZE = 10
+MAX_BODY_LENGTH = 10000
+
+
 def move_sqs_message(message, to_queue):
     response = to_queue.send_message(
         MessageBody=message.body,
@@ -9,29 +37,287 @@ def move_sqs_message(message, to_queue):
         raise Exception('Error while trying to move message to another queue')
 
 
+def retry_batch(operation, entries):
+    """
+    Call `operation(Entries=...)` until every entry succeeds, retrying
+    only the failed ones (and never the ones SQS blames on the sender).
+    Batches too big for one request are split in halves (down to
+    single entries) and throttled requests are retried, too; any other
+    error fails every pending entry.
+
+    Returns the ids of the successful entries and the failures.
+    """
+    pending = {entry['Id']: entry for entry in entries}
+    successful = []
+    failed = []
+
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(0.2 * 2 ** attempt)
+
+        try:
+            response = operation(Entries=list(pending.values()))
+        except (BotoCoreError, ClientError) as ex:
+            code = getattr(ex, 'response', {}).get('Error', {}).get('Code', '')
+            if code in THROTTLING_ERRORS:
+                continue
+
+            if code in TOO_LONG_ERRORS and len(pending) > 1:
+                entries = list(pending.values())
+                middle = len(entries) // 2
+                for half in (entries[:middle], entries[middle:]):
+                    half_successful, half_failed = retry_batch(operation, half)
+                    successful.extend(half_successful)
+                    failed.extend(half_failed)
+                return successful, failed
+
+            the_type = type(ex)
+            failed.extend({'Id': entry_id, 'Message': f'{the_type}: {ex}'} for entry_id in pending)
+            return successful, failed
+
+        for success in response.get('Successful', []):
+            successful.append(success['Id'])
+            del pending[success['Id']]
+
+        for failure in response.get('Failed', []):
+            if failure.get('SenderFault'):
+                failed.append(failure)
+                del pending[failure['Id']]
+
+        if not pending:
+            break
+    else:
+        failed.extend({'Id': entry_id, 'Message': 'Too many attempts'} for entry_id in pending)
+
+    return successful, failed
+
+
+def move_sqs_messages(messages, from_queue, to_queue):
+    """
+    Move up to 10 messages with a single SendMessageBatch and delete
+    (with a single DeleteMessageBatch) only the ones that were sent.
+
+    Returns how many messages were moved and the failures.
+    """
+    messages_by_id = {f'{index}': message for index, message in enumerate(messages)}
+
+    sent, send_failures = retry_batch(to_queue.send_messages, [
+        {
+            'Id': message_id,
+            'MessageBody': message.body,
+            'MessageAttributes': message.message_attributes or {},
+        }
+        for message_id, message in messages_by_id.items()
+    ])
+    if not sent:
+        return 0, send_failures
+
+    deleted, delete_failures = retry_batch(from_queue.delete_messages, [
+        {
+            'Id': message_id,
+            'ReceiptHandle': messages_by_id[message_id].receipt_handle,
+        }
+        for message_id in sent
+    ])
+    return len(deleted), send_failures + delete_failures
+
+
+def get_sent_timestamp(message):
+    return int(message.attributes.get('SentTimestamp', 0))
+
+
+def stratified_sample(messages, count):
+    """
+    Pick `count` messages spread along the time they were sent:
+    sorted by `SentTimestamp`, they are split into `count` strata
+    of the same size and a random one is taken from each.
+    """
+    if len(messages) <= count:
+        return sorted(messages, key=get_sent_timestamp)
+
+    messages = sorted(messages, key=get_sent_timestamp)
+    stratum_size = len(messages) / count
+    return [
+        random.choice(messages[int(index * stratum_size):int((index + 1) * stratum_size)])
+        for index in range(count)
+    ]
+
+
+def write_messages_page(monitor, messages, first_number):
+    last_number = first_number + len(messages) - 1
+    monitor.h2(f'Messages {first_number} to {last_number}')
+
+    for message in messages:
+        sent_at = datetime.fromtimestamp(get_sent_timestamp(message) / 1000)
+        receive_count = message.attributes.get('ApproximateReceiveCount', '?')
+        monitor.h3(f'{message.message_id} (sent at {sent_at:%Y-%m-%d %H:%M:%S}, received {receive_count} times)')
+
+        if message.message_attributes:
+            monitor.write(f"{message.message_attributes}", indentation=1)
+
+        body = message.body
+        if len(body) > MAX_BODY_LENGTH:
+            body = body[:MAX_BODY_LENGTH] + f' [...] ({len(message.body)} characters)'
+        monitor.write(body, indentation=1)
+        monitor.hr()
+
+
+class MessagesMover:
+    """
+    Moves up to `limit` messages from one queue to another, in batches,
+    with many receivers working at the same time.
+    """
+
+    def __init__(self, from_queue, to_queue, limit, monitor):
+        self.from_queue = from_queue
+        self.to_queue = to_queue
+        self.remaining = limit
+        self.monitor = monitor
+
+        self.condition = threading.Condition()
+        self.moved = 0
+        self.running = 0
+        self.finished = False
+
+    def reserve(self):
+        with self.condition:
+            count = min(self.remaining, MAX_BATCH_SIZE)
+            self.remaining -= count
+            return count
+
+    def give_back(self, count):
+        with self.condition:
+            self.remaining += count
+
+    def work(self):
+        with self.condition:
+            if self.finished:
+                return
+            self.running += 1
+
+        try:
+            while self.monitor.alive:
+                count = self.reserve()
+                if not count:
+                    return
+
+                try:
+                    messages = self.from_queue.receive_messages(
+                        MaxNumberOfMessages=count,
+                        WaitTimeSeconds=2,
+                        MessageAttributeNames=['All']
+                    )
+                except (BotoCoreError, ClientError) as ex:
+                    self.give_back(count)
+                    the_type = type(ex)
+                    self.monitor.write(f'{the_type}: {ex}')
+                    return
+                self.give_back(count - len(messages))
+                if not messages:
+                    return
+
+                moved, failures = move_sqs_messages(messages, self.from_queue, self.to_queue)
+                with self.condition:
+                    self.moved += moved
+                    total = self.moved
+
+                self.monitor.write(f'{total} messages moved')
+                for failure in failures:
+                    failure_id = failure['Id']
+                    failure_message = failure.get('Message', '')
+                    self.monitor.write(f'Failed to move message {failure_id}: {failure_message}', indentation=1)
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.condition.notify_all()
+
+    def run(self, receivers, submit):
+        """
+        Start `receivers - 1` receivers through `submit` and work as one
+        of them. Receivers that didn't start until we are done won't.
+        """
+        for _ in range(receivers - 1):
+            submit(self.work)
+
+        try:
+            self.work()
+        finally:
+            with self.condition:
+                self.finished = True
+                while self.running:
+                    self.condition.wait()
+        return self.moved
+
+
 class SQSOperationsMixin:
-    def view_messages(self, queue):
-        monitor = self.open_monitor('View messages')
+    def view_messages(self, queue, limit=50, sample=False):
+        """
+        Show up to `limit` messages, `PAGE_SIZE` at a time.
 
-        while monitor.alive:
-            messages = queue.receive_messages(
-                MaxNumberOfMessages=10,
-                AttributeNames=['All'],
+        Messages are hidden from other consumers for only
+        `VIEW_VISIBILITY_TIMEOUT` seconds. With `sample`, a bigger pool
+        is received and the messages shown are spread along the time
+        they were sent.
+        """
+        limit = min(limit, MAX_VIEW_MESSAGES)
+        if sample:
+            wanted = min(limit * SAMPLE_POOL_FACTOR, MAX_VIEW_MESSAGES)
+        else:
+            wanted = limit
+
+        monitor = self.open_monitor('View messages', text_mode=True)
+        messages = {}
+        page = []
+        duplicate_batches = 0
+
+        while monitor.alive and len(messages) < wanted:
+            received = queue.receive_messages(
+                MaxNumberOfMessages=min(wanted - len(messages), MAX_BATCH_SIZE),
+                WaitTimeSeconds=VIEW_WAIT_TIME,
+                VisibilityTimeout=VIEW_VISIBILITY_TIMEOUT,
+                AttributeNames=['SentTimestamp', 'ApproximateReceiveCount'],
                 MessageAttributeNames=['All']
             )
-            if not messages:
-                self.info(f'No more messages in {queue}')
-                return
 
-            for message in messages:
-                if not monitor.alive:
-                    return
+            if not received:
+                break
+
+            # Shown messages become visible again after
+            # `VIEW_VISIBILITY_TIMEOUT` seconds, so they may come back
+            # even while there are unseen ones left:
+            new_messages = [message for message in received if message.message_id not in messages]
+            if not new_messages:
+                duplicate_batches += 1
+                if duplicate_batches >= MAX_DUPLICATE_BATCHES:
+                    break
+                continue
+            duplicate_batches = 0
 
-                monitor.write(f"{message.message_attributes}", indentation=1)
-                monitor.write(f"{message.body}", indentation=1)
-                monitor.hr()
+            for message in new_messages:
+                messages[message.message_id] = message
+
+            if not sample:
+                page.extend(new_messages)
+                if len(page) >= PAGE_SIZE:
+                    write_messages_page(monitor, page, len(messages) - len(page) + 1)
+                    page = []
+
+        if sample:
+            page = stratified_sample(list(messages.values()), limit)
+            for index in range(0, len(page), PAGE_SIZE):
+                write_messages_page(monitor, page[index:index + PAGE_SIZE], index + 1)
+        elif page:
+            write_messages_page(monitor, page, len(messages) - len(page) + 1)
+
+        self.info(f'{len(messages)} messages received from {queue.url}')
 
     def move_messages(self, from_queue, to_queue, messages_limit=50, cherrypick=False):
+        if not cherrypick:
+            monitor = self.open_monitor('Moving messages', text_mode=True)
+            mover = MessagesMover(from_queue, to_queue, messages_limit, monitor)
+            receivers = int(self.get_config('receivers', 4))
+            return mover.run(receivers, monitor.enqueue)
+
         messages_count = 0
 
         monitor = self.open_monitor('Dead queue messages recovery')
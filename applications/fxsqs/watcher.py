@@ -0,0 +1,107 @@
+import time
+
+from fxi.dispatcher import post
+
+
+# Only what the table shows:
+WATCHED_ATTRIBUTES = ['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+
+MIN_INTERVAL = 2
+MAX_INTERVAL = 60
+BACKOFF_FACTOR = 1.5
+
+
+class QueueState:
+    def __init__(self):
+        self.interval = MIN_INTERVAL
+        self.next_poll = 0
+        self.polling = False
+        self.count = None
+        self.in_transit_count = None
+        self.sampled_at = None
+
+
+class QueuesWatcher:
+    """
+    Keeps the queues table up to date while it is running.
+
+    Each queue is polled on its own schedule: every `MIN_INTERVAL`
+    seconds while its counts are changing, less and less often
+    (up to `MAX_INTERVAL`) while they are stable. Rates in and out
+    come from the difference between two successive samples.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.states = {}
+        self.active = False
+        self.generation = 0
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self.generation += 1
+        self.app.enqueue_background(self.tick, self.generation)
+
+    def stop(self):
+        self.active = False
+
+    def schedule_tick(self, generation):
+        # Must be called from the main loop.
+        self.app.tab.after(MIN_INTERVAL * 1000, self.app.enqueue_background, self.tick, generation)
+
+    def tick(self, generation):
+        if not self.active or generation != self.generation or not self.app.alive:
+            return
+
+        now = time.monotonic()
+        for entry in self.app.main_list.entries:
+            state = self.states.setdefault(entry.data['name'], QueueState())
+            if state.polling or state.next_poll > now:
+                continue
+
+            state.polling = True
+            self.app.enqueue_background(self.poll, entry, state)
+
+        post(self.schedule_tick, generation)
+
+    def poll(self, entry, state):
+        try:
+            self.do_poll(entry, state)
+        finally:
+            state.polling = False
+
+    def do_poll(self, entry, state):
+        data = entry.data
+        response = self.app.client.meta.client.get_queue_attributes(
+            QueueUrl=data['object'].url,
+            AttributeNames=WATCHED_ATTRIBUTES
+        )
+        attributes = response['Attributes']
+        count = int(attributes['ApproximateNumberOfMessages'])
+        in_transit_count = int(attributes['ApproximateNumberOfMessagesNotVisible'])
+        now = time.monotonic()
+
+        new_data = dict(data, count=count, in_transit_count=in_transit_count)
+        if state.sampled_at is not None:
+            # Only the net variation is known, so a queue receiving and
+            # consuming at the same pace shows no rate at all.
+            net_rate = (count - state.count) / (now - state.sampled_at)
+            new_data['net_rate'] = f'{net_rate:+.1f}'
+
+        changed = (count, in_transit_count) != (state.count, state.in_transit_count)
+        if changed:
+            state.interval = MIN_INTERVAL
+        else:
+            state.interval = min(state.interval * BACKOFF_FACTOR, MAX_INTERVAL)
+
+        state.count = count
+        state.in_transit_count = in_transit_count
+        state.sampled_at = now
+        state.next_poll = now + state.interval
+
+        keys = ('count', 'in_transit_count', 'net_rate')
+        if any(new_data.get(key) != data.get(key) for key in keys):
+            self.app.queues[data['name']] = new_data
+            entry.refresh(new_data)
@@ -7,7 +7,7 @@ from fxi.table import Table
 
 class App(AppBase):
     def init(self):
-        self.table = Table(
+        self.main_list = Table(
             self.tab.interior,
             (('phrase',), ('count', 'rand'), ('word',)),
             ('Phrase', '', 'Word')
@@ -31,7 +31,7 @@ class App(AppBase):
 
     def render(self):
         self.h1('Test App')
-        self.table.render(self.data)
+        self.main_list.render(self.data)
 
     # Commands:
     def cmd__sleep(self, *args):
@@ -25,7 +25,7 @@ class App(AppBase):
 
         if page.images:
             slot = monitor.add_slot()
-            self.enqueue(self.show_cover, slot, page.images[0])
+            monitor.enqueue(self.show_cover, slot, page.images[0])
 
         monitor.write(page.summary)
         monitor.hr()
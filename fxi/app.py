@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0x89453e97
+# __coconut_hash__ = 0x96c7c24c
 
 # Compiled with Coconut version 1.3.1 [Dead Parrot]
 
@@ -517,12 +517,17 @@ _coconut_MatchError, _coconut_count, _coconut_enumerate, _coconut_reversed, _coc
 
 # Compiled Coconut: -----------------------------------------------------------
 
+from os import environ
 import tkinter
 from tkinter import ttk
 
 from .command_line import CommandLine
+from .dispatcher import UIDispatcher
+from .dispatcher import set_dispatcher
+from .dispatcher import ui_operation
 from .prompt import Prompt
 from .notebook import Notebook
+from .scheduler import Scheduler
 
 from .windowed_app import WindowedApp
 from .pluggable_apps import PluggableAppsAppMixin
@@ -532,6 +537,12 @@ class FXI(PluggableAppsAppMixin, WindowedApp):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.dispatcher = UIDispatcher(self.main_window)
+        set_dispatcher(self.dispatcher)
+
+        self.scheduler = Scheduler(max_workers=int(environ.get('FXI_MAX_WORKERS', 16)))
+        self.tasks = self.scheduler.new_queue('fxi')
+
         self.notebook = Notebook(self)
         self.notebook.pack(expand=1, fill='both')
 
@@ -549,6 +560,7 @@ class FXI(PluggableAppsAppMixin, WindowedApp):
         self.status['text'] = "Welcome"
         self.status.pack(fill=tkinter.X)
 
+    @ui_operation
     def info(self, message):
 # TODO:
 # 1- Save historic data for messages.
@@ -568,4 +580,6 @@ class FXI(PluggableAppsAppMixin, WindowedApp):
             self.command_line.handle_command(command_line_arg)
         self.main_window.mainloop()
         self.alive = False
+        self.dispatcher.stop()
         self.stop_apps()
+        self.scheduler.shutdown()
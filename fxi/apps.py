@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0x3b56b705
+# __coconut_hash__ = 0x5d244946
 
 # Compiled with Coconut version 1.4.0 [Ernest Scribbler]
 
@@ -553,21 +553,23 @@ _coconut_MatchError, _coconut_count, _coconut_enumerate, _coconut_makedata, _coc
 import json
 from os import environ
 from pathlib import PosixPath
-from queue import Queue
-from queue import Empty
 import threading
 import tkinter
 from tkinter import ttk
-import time
 from urllib.parse import quote_plus as urlquote
 from urllib.parse import urljoin
 from urllib.parse import urlparse
 
-import requests
 from pyquery import PyQuery
 
+from fxi import http_client
+from fxi.dispatcher import ui_call
+from fxi.dispatcher import ui_operation
+from fxi.scheduler import PRIORITY_BACKGROUND
+from fxi.scheduler import PRIORITY_COMMAND
 from fxi.widgets.scrollables import VerticalScrolledFrame
 from fxi.monitor import Monitor
+from fxi.monitor import TextMonitor
 from fxi.utils import apply_surrogates
 
 
@@ -611,27 +613,24 @@ class HTTPMixin:
 
     @_coconut_tco
     def request(self, url, message=None, method='get', **kwargs):
-        method = getattr(requests, method.lower())
-
 # TODO: detect if the response mime type is content/json
 
         referer = self.get_referer(url)
-        headers = {'Referer': referer, 'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:65.0) Gecko/20100101 Firefox/65.0'}
+        headers = {'Referer': referer, 'User-Agent': http_client.USER_AGENT}
         user_headers = kwargs.pop('headers', {})
         headers.update(user_headers)
 
         message = message or f'Loading {url}...'
 
         with self.info(message):
-            response = method(url, headers=headers, **kwargs)
-            print(' status_code:', response.status_code)
+            response = http_client.get_client().request(method, url, headers=headers, **kwargs)
             response.raise_for_status()
-            print(' content:', response.content)
         return _coconut_tail_call((PyQuery), response.content)
 
 
 class AppBase:
     title = 'App Title'
+    max_workers = 8
 
     def __init__(self, fxi):
         self.fxi = fxi
@@ -645,15 +644,14 @@ class AppBase:
         self.unsaved_config = {}
         self.load_config()
 
-        self.tasks_queue = Queue()
-        self.threads_pool = []
-        self.adding_thread_to_pool = False
+        self.executor = fxi.scheduler.new_queue(self.title, max_workers=self.max_workers, on_error=self.report_task_error)
 
     def init(self):
         pass
 
     def quit(self):
         self.alive = False
+        self.executor.shutdown()
         self.tab.destroy()
         self.persist_config()
 
@@ -686,8 +684,7 @@ class AppBase:
         method_name = f'cmd__{cmd_name}'
         method = getattr(self, method_name, None)
         if method:
-            t = threading.Thread(target=method, args=args)
-            t.start()
+            self.executor.submit_task(method, args, priority=PRIORITY_COMMAND)
             return
 
         self.info(f'Unknown command: {cmd_name}')
@@ -695,7 +692,7 @@ class AppBase:
     def cmd__help(self):
         """Show help about available commands"""
 
-        monitor = self.open_monitor(f'{self.title}: Help')
+        monitor = self.open_monitor(f'{self.title}: Help', text_mode=True)
         for entry_name in dir(self):
             if entry_name.startswith('cmd__'):
                 name = entry_name.replace('cmd__', '')
@@ -710,12 +707,34 @@ class AppBase:
     def cmd__status(self):
         monitor = self.open_monitor(f'{self.title}: Status')
 
-        monitor.write(f'Threads pool size: {self.threads_counter}')
-
-    def open_monitor(self, name=None):
+        scheduler = self.fxi.scheduler
+        monitor.write(f'Threads pool size: {scheduler.workers_count} (max: {scheduler.max_workers})')
+        monitor.write(f'Active threads: {scheduler.active_workers_count}')
+        monitor.write(f'Queued tasks: {scheduler.queue_size}')
+
+        monitor.h2('Tasks per app')
+        for queue in tuple(scheduler.queues):
+            wait_time = queue.average_wait_time * 1000
+            run_time = queue.average_run_time * 1000
+            monitor.write(f'{queue.name}: {queue.queue_size} queued, ' f'{queue.active} running (max: {queue.max_workers}), ' f'{queue.completed} done, {queue.failed} failed, ' f'avg. wait {wait_time:.0f}ms, avg. run {run_time:.0f}ms')
+
+        cache = http_client.get_client().cache
+        if cache is not None:
+            size = cache.size / (1024 * 1024)
+            monitor.write(f'HTTP cache: {cache.hit_ratio:.0%} hit ratio ' f'({cache.hits} hits, {cache.misses} misses, {size:.1f} MB on disk)')
+
+    @ui_call
+    def open_monitor(self, name=None, text_mode=False):
+        """
+        Replace the current monitor with a new one.
+
+        With `text_mode`, the monitor is a `TextMonitor`:
+        much lighter for long outputs of plain text.
+        """
         self.close_monitor()
 
-        monitor = Monitor(self, relief=tkinter.RIDGE)
+        monitor_class = TextMonitor if text_mode else Monitor
+        monitor = monitor_class(self, relief=tkinter.RIDGE)
 
         if name:
             monitor.h1(name)
@@ -730,6 +749,7 @@ class AppBase:
     def close_monitor(self):
         (lambda x: None if x is None else x.close())(self.current_monitor)
 
+    @ui_operation
     def h1(self, title):
         label = ttk.Label(self.tab.interior, text=f'{title}', anchor=tkinter.W, justify=tkinter.LEFT, style='h1.TLabel')
 
@@ -798,57 +818,19 @@ class AppBase:
             json.dump(self.config, file_object)
 
     def enqueue(self, function, *args, **kwargs):
-        self.tasks_queue.put((function, args, kwargs))
-
-        num_threads = len(self.threads_pool)
-        qsize = self.tasks_queue.qsize()
+        self.executor.submit(function, *args, **kwargs)
 
-        if num_threads == 0 and qsize > 0:
-            self.add_thread_to_pool()
-        elif qsize > num_threads / 2:
-            self.add_thread_to_pool()
+    def enqueue_background(self, function, *args, **kwargs):
+        """Enqueue something that can wait for everything else (like a refresh)."""
+        self.executor.submit_task(function, args, kwargs, PRIORITY_BACKGROUND)
 
-    def tasks_thread(self):
-        sleep_time = 0.5
-        max_inactivity_time = 60
-        inactivity_time_counter = 0
-
-        while self.alive and inactivity_time_counter < max_inactivity_time:
-            try:
-                task = self.tasks_queue.get(timeout=1)
-            except Empty:
-                time.sleep(sleep_time)
-                inactivity_time_counter += sleep_time
-                continue
-
-            inactivity_time_counter = 0
-            function, args, kwargs = task
-            try:
-                function(*args, **kwargs)
-            except Exception as ex:
-                the_type = type(ex)
-                print(f'{the_type}: {ex}')
-                continue
+    def report_task_error(self, function, ex):
+        the_type = type(ex)
+        self.info(f'{the_type}: {ex}')
 
     @property
-    @_coconut_tco
     def threads_counter(self):
-        for thread in tuple(self.threads_pool):
-            if not thread.is_alive():
-                self.threads_pool.remove(thread)
-
-        return _coconut_tail_call(len, self.threads_pool)
-
-    def add_thread_to_pool(self):
-        if self.adding_thread_to_pool:
-            return
-        self.adding_thread_to_pool = True
-
-        t = threading.Thread(target=self.tasks_thread)
-        t.start()
-        self.threads_pool.append(t)
-        time.sleep(0.5)  # We don't want TOO MUCH threads being created so fast.
-        self.adding_thread_to_pool = False
+        return self.executor.active
 
     @_coconut_tco
     def ask(self, *args, **kwargs):
@@ -882,6 +864,55 @@ class AppBase:
         for index, item in enumerate(later_list):
             monitor.write(f'{index:>4}: {item}')
 
+    def get_table_column(self, name):
+        if self.main_list is None:
+            self.info('There is no table to work with, here.')
+            return None
+
+        key = self.main_list.get_column_key(name)
+        if key is None:
+            self.info(f'Unknown column: {name}')
+        return key
+
+    def cmd__sort(self, column=None):
+        """
+        Sort the table by <column> (its header, key or number).
+        Prefix it with "-" for descending order. Without
+        a column, the original order is restored.
+
+        Usage: sort [-]<column>
+        """
+        if column is None:
+            (lambda x: None if x is None else x.sort())(self.main_list)
+            return
+
+        reverse = column.startswith('-')
+        key = self.get_table_column(column.lstrip('-'))
+        if key is not None:
+            self.main_list.sort(key, reverse)
+
+    def cmd__filter(self, column=None, *words):
+        """
+        Show only the table rows whose <column> matches <expression>.
+        Expressions may start with >, <, >=, <=, = or !=; otherwise
+        they match values containing the given text. Without an
+        expression, the column filter is removed and without
+        a column, every filter is.
+
+        Usage: filter <column> <expression>
+
+        Examples:
+            filter messages >0
+            filter name dead-letter
+        """
+        if column is None:
+            (lambda x: None if x is None else x.filter())(self.main_list)
+            return
+
+        key = self.get_table_column(column)
+        if key is not None:
+            self.main_list.filter(key, ' '.join(words))
+
     def copy_to_clipboard(self, string):
         self.tab.clipboard_clear()
         self.tab.clipboard_append(string)
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0xd09040f8
+# __coconut_hash__ = 0xc977bec9
 
 # Compiled with Coconut version 1.3.1 [Dead Parrot]
 
@@ -519,10 +519,11 @@ _coconut_MatchError, _coconut_count, _coconut_enumerate, _coconut_reversed, _coc
 
 import importlib
 import re
-import threading
 import tkinter
 from tkinter.ttk import Entry
 
+from .scheduler import PRIORITY_COMMAND
+
 
 def bind_key(keysym, ctrl):
     def decorator(method):
@@ -813,8 +814,7 @@ def do_handle_command(*_coconut_match_to_args, **_coconut_match_to_kwargs):
 @addpattern(do_handle_command)
 def do_handle_command(self, head, parsed_args):
     if head in self.parent.available_apps:
-        t = threading.Thread(target=self.parent.open_app, args=[head, parsed_args])
-        t.start()
+        self.parent.tasks.submit_task(self.parent.open_app, (head, parsed_args), priority=PRIORITY_COMMAND)
         return
 
     if self.parent.current_app:
@@ -0,0 +1,130 @@
+from collections import deque
+import functools
+import threading
+import time
+import traceback
+
+
+class UIDispatcher:
+    """
+    Runs widget operations on the Tk main loop.
+
+    Worker threads shouldn't talk to Tk directly: each call becomes
+    a synchronous round trip to the main thread. Instead, they `post`
+    operations here and the main loop runs them in batches, every
+    `interval` milliseconds, for no longer than `time_budget` seconds
+    at a time (so the interface keeps responding to the user).
+    """
+
+    def __init__(self, window, interval=20, time_budget=0.02):
+        self.window = window
+        self.interval = interval
+        self.time_budget = time_budget
+
+        self.operations = deque()
+        self.main_thread = threading.current_thread()
+        self.alive = True
+
+        self.window.after(self.interval, self.drain)
+
+    def in_main_thread(self):
+        return threading.current_thread() is self.main_thread
+
+    def post(self, function, *args, **kwargs):
+        """Run `function` on the main loop, as soon as possible. Don't wait."""
+        if not self.alive:
+            return
+
+        if self.in_main_thread() and not self.operations:
+            function(*args, **kwargs)
+            return
+
+        self.operations.append((function, args, kwargs))
+
+    def call(self, function, *args, **kwargs):
+        """Run `function` on the main loop and wait for its return value."""
+        if not self.alive:
+            return None
+
+        if self.in_main_thread():
+            self.run_pending()
+            return function(*args, **kwargs)
+
+        done = threading.Event()
+        result = {}
+
+        def operation():
+            try:
+                result['value'] = function(*args, **kwargs)
+            except Exception as ex:
+                result['exception'] = ex
+            done.set()
+
+        self.operations.append((operation, (), {}))
+
+        while not done.wait(0.1):
+            if not self.alive:
+                return None
+
+        if 'exception' in result:
+            raise result['exception']
+        return result['value']
+
+    def run_pending(self, deadline=None):
+        while self.operations:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+
+            function, args, kwargs = self.operations.popleft()
+            try:
+                function(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+
+    def drain(self):
+        if not self.alive:
+            return
+
+        self.run_pending(time.monotonic() + self.time_budget)
+        self.window.after(self.interval, self.drain)
+
+    def stop(self):
+        self.alive = False
+        self.operations.clear()
+
+
+_dispatcher = None
+
+
+def set_dispatcher(dispatcher):
+    global _dispatcher
+    _dispatcher = dispatcher
+
+
+def post(function, *args, **kwargs):
+    if _dispatcher is None:
+        function(*args, **kwargs)
+        return
+    _dispatcher.post(function, *args, **kwargs)
+
+
+def call(function, *args, **kwargs):
+    if _dispatcher is None:
+        return function(*args, **kwargs)
+    return _dispatcher.call(function, *args, **kwargs)
+
+
+def ui_operation(method):
+    """Decorator: the method runs on the Tk main loop, without waiting for it."""
+    @functools.wraps(method)
+    def new_method(*args, **kwargs):
+        post(method, *args, **kwargs)
+    return new_method
+
+
+def ui_call(method):
+    """Decorator: the method runs on the Tk main loop and we wait for its result."""
+    @functools.wraps(method)
+    def new_method(*args, **kwargs):
+        return call(method, *args, **kwargs)
+    return new_method
@@ -0,0 +1,295 @@
+from email.utils import parsedate_to_datetime
+from hashlib import sha256
+import json
+from os import environ
+from pathlib import PosixPath
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+
+def get_expiration(response, now):
+    """
+    When (timestamp) does this response stop being fresh?
+
+    Returns None if it should not be stored at all.
+    """
+    headers = response.headers
+    cache_control = parse_cache_control(headers.get('Cache-Control'))
+
+    if 'no-store' in cache_control or headers.get('Vary') == '*':
+        return None
+
+    if 'no-cache' in cache_control:
+        return now
+
+    try:
+        return now + int(cache_control['max-age'])
+    except (KeyError, ValueError):
+        pass
+
+    if 'Expires' in headers:
+        return parse_http_date(headers['Expires']) or now
+
+    # Heuristic freshness: 10% of the time since last modification,
+    # but never more than one day.
+    last_modified = parse_http_date(headers.get('Last-Modified'))
+    if last_modified:
+        date = parse_http_date(headers.get('Date')) or now
+        return now + min(max(date - last_modified, 0) * 0.1, 86400)
+
+    if 'ETag' in headers:
+        return now
+
+    return None
+
+
+class HTTPCache:
+    """
+    Content-addressed on-disk cache for GET responses.
+
+    Bodies are saved under `blobs/` named by their SHA-256 (so the
+    same image served by different URLs is stored once) and a small
+    SQLite index maps URLs to blobs, validators and expiration time.
+    Least recently used entries are evicted when `max_size` is reached.
+    """
+
+    def __init__(self, path=None, max_size=512 * 1024 * 1024):
+        self.path = path or (PosixPath(environ['HOME']) / '.cache' / 'fxi' / 'http')
+        self.blobs_path = self.path / 'blobs'
+        self.blobs_path.mkdir(exist_ok=True, parents=True)
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            str(self.path / 'index.sqlite3'),
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=OFF')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' url TEXT PRIMARY KEY, digest TEXT, headers TEXT,'
+            ' expires REAL, last_access REAL)'
+        )
+        try:
+            # Request headers named by `Vary` (caches made before it lack the column):
+            self.db.execute('ALTER TABLE entries ADD COLUMN vary TEXT')
+        except sqlite3.OperationalError:
+            pass
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER)'
+        )
+        self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0
+        return self.hits / total
+
+    def blob_path(self, digest):
+        return self.blobs_path / digest[:2] / digest
+
+    def lookup(self, url, request_headers=None):
+        """
+        The entry for `url`, unless the response varies (see `Vary`)
+        on request headers whose values differ from `request_headers`.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT digest, headers, expires, vary FROM entries WHERE url = ?', (url,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        digest, headers, expires, vary = row
+        request_headers = CaseInsensitiveDict(request_headers or {})
+        for name, value in json.loads(vary or '{}').items():
+            if request_headers.get(name) != value:
+                return None
+
+        if not self.blob_path(digest).exists():
+            self.forget(url)
+            return None
+
+        return {
+            'url': url,
+            'digest': digest,
+            'headers': json.loads(headers),
+            'expires': expires,
+        }
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry['expires'] > time.time()
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        etag = entry['headers'].get('ETag')
+        if etag:
+            headers['If-None-Match'] = etag
+        last_modified = entry['headers'].get('Last-Modified')
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def build_response(self, entry):
+        """A response with the cached body, or None if it's gone (evicted meanwhile)."""
+        try:
+            content = self.blob_path(entry['digest']).read_bytes()
+        except FileNotFoundError:
+            self.forget(entry['url'])
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = content
+        response.from_cache = True
+        return response
+
+    def hit(self, entry):
+        response = self.build_response(entry)
+        if response is None:
+            return None
+
+        with self.lock:
+            self.hits += 1
+            self.db.execute(
+                'UPDATE entries SET last_access = ? WHERE url = ?',
+                (time.time(), entry['url'])
+            )
+        return response
+
+    def revalidated(self, entry, response):
+        """The server answered "304 Not Modified" to a conditional GET."""
+        now = time.time()
+        expires = get_expiration(response, now)
+        if expires is None:
+            expires = now
+
+        for key in KEPT_HEADERS:
+            if key in response.headers:
+                entry['headers'][key] = response.headers[key]
+        entry['expires'] = expires
+
+        with self.lock:
+            self.db.execute(
+                'UPDATE entries SET headers = ?, expires = ? WHERE url = ?',
+                (json.dumps(entry['headers']), expires, entry['url'])
+            )
+        return self.hit(entry)
+
+    def store(self, url, response):
+        with self.lock:
+            self.misses += 1
+
+        if response.status_code != 200:
+            return
+
+        now = time.time()
+        expires = get_expiration(response, now)
+        if expires is None:
+            return
+
+        content = response.content
+        digest = sha256(content).hexdigest()
+        headers = {key: response.headers[key] for key in KEPT_HEADERS if key in response.headers}
+        request_headers = response.request.headers if response.request is not None else {}
+        vary = {
+            name.strip(): request_headers.get(name.strip())
+            for name in response.headers.get('Vary', '').split(',')
+            if name.strip()
+        }
+
+        path = self.blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_name(f'{digest}.{threading.get_ident()}.tmp')
+            tmp_path.write_bytes(content)
+            tmp_path.rename(path)
+
+        with self.lock:
+            known = self.db.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if not known:
+                self.db.execute('INSERT INTO blobs VALUES (?, ?)', (digest, len(content)))
+                self.size += len(content)
+
+            old_entry = self.db.execute('SELECT digest FROM entries WHERE url = ?', (url,)).fetchone()
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries (url, digest, headers, expires, last_access, vary)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (url, digest, json.dumps(headers), expires, now, json.dumps(vary))
+            )
+            if old_entry and old_entry[0] != digest:
+                self.release_blob(old_entry[0])
+
+            if self.size > self.max_size:
+                self.evict()
+
+    def forget(self, url):
+        with self.lock:
+            row = self.db.execute('SELECT digest FROM entries WHERE url = ?', (url,)).fetchone()
+            if row:
+                self.db.execute('DELETE FROM entries WHERE url = ?', (url,))
+                self.release_blob(row[0])
+
+    def release_blob(self, digest):
+        # Must be called with `self.lock` held.
+        in_use = self.db.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+        if in_use:
+            return
+
+        row = self.db.execute('SELECT size FROM blobs WHERE digest = ?', (digest,)).fetchone()
+        if row:
+            self.db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+            self.size -= row[0]
+
+        try:
+            self.blob_path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        # Must be called with `self.lock` held.
+        target_size = self.max_size * 0.9
+        rows = self.db.execute('SELECT url, digest FROM entries ORDER BY last_access').fetchall()
+        for url, digest in rows:
+            if self.size <= target_size:
+                break
+            self.db.execute('DELETE FROM entries WHERE url = ?', (url,))
+            self.release_blob(digest)
@@ -0,0 +1,135 @@
+from http.cookiejar import DefaultCookiePolicy
+from os import environ
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from .http_cache import HTTPCache
+
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:65.0) Gecko/20100101 Firefox/65.0'
+
+# Requests carrying credentials are never cached:
+PRIVATE_HEADERS = {'authorization', 'cookie', 'proxy-authorization'}
+
+
+class HTTPClient:
+    """
+    Process-wide HTTP client.
+
+    Keeps connections alive between requests (so we don't pay for
+    a new TCP+TLS handshake on every thumbnail) and caps how many
+    connections are open against each host at the same time.
+
+    Plain GET requests go through `cache` (if any), so repeated
+    downloads are served from disk or revalidated with a conditional GET.
+    The session is shared by every app, so it keeps no cookies: apps
+    that need them pass `cookies=` themselves.
+    """
+
+    def __init__(self, max_per_host=6, max_hosts=32, timeout=(5, 30), retries=3, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=max_hosts,
+            pool_maxsize=max_per_host,
+            pool_block=True,
+            max_retries=retry
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        headers = kwargs.get('headers') or {}
+        cacheable = (
+            self.cache is not None and
+            method.lower() == 'get' and
+            not any(key in kwargs for key in ('params', 'data', 'json', 'stream', 'cookies', 'auth')) and
+            not any(name.lower() in PRIVATE_HEADERS for name in headers)
+        )
+        if cacheable:
+            return self.cached_get(url, **kwargs)
+
+        return self.session.request(method.upper(), url, **kwargs)
+
+    def cached_get(self, url, **kwargs):
+        request_headers = dict(self.session.headers)
+        request_headers.update(kwargs.get('headers') or {})
+        entry = self.cache.lookup(url, request_headers)
+
+        if entry is not None and self.cache.is_fresh(entry):
+            response = self.cache.hit(entry)
+            if response is not None:
+                return response
+            # Its body was evicted meanwhile:
+            entry = None
+
+        if entry is None:
+            response = self.session.get(url, **kwargs)
+        else:
+            headers = dict(kwargs.get('headers') or {})
+            headers.update(self.cache.conditional_headers(entry))
+            response = self.session.get(url, **dict(kwargs, headers=headers))
+
+            if response.status_code == 304:
+                cached_response = self.cache.revalidated(entry, response)
+                if cached_response is not None:
+                    return cached_response
+                # Not modified, but evicted meanwhile: ask for it again.
+                response = self.session.get(url, **kwargs)
+
+        self.cache.store(url, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('get', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('post', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient(
+                max_per_host=int(environ.get('FXI_HTTP_MAX_PER_HOST', 6)),
+                timeout=(
+                    float(environ.get('FXI_HTTP_CONNECT_TIMEOUT', 5)),
+                    float(environ.get('FXI_HTTP_READ_TIMEOUT', 30))
+                ),
+                retries=int(environ.get('FXI_HTTP_RETRIES', 3)),
+                cache=get_cache()
+            )
+        return _client
+
+
+def get_cache():
+    max_size = int(environ.get('FXI_HTTP_CACHE_SIZE', 512))
+    if max_size <= 0:
+        return None
+    return HTTPCache(max_size=max_size * 1024 * 1024)
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from hashlib import sha256
+from io import BytesIO
+from os import environ
+from pathlib import PosixPath
+import threading
+
+from PIL import Image, features
+
+from fxi import http_client
+
+
+# Use it as `max_height` when only the width matters.
+UNLIMITED = 100000
+
+if features.check('webp'):
+    THUMBNAILS_FORMAT = 'WEBP'
+else:
+    THUMBNAILS_FORMAT = 'PNG'
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def image_size_in_bytes(image):
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class ThumbnailCache:
+    """
+    Two-level cache of already resized images.
+
+    Entries are keyed by (url, max_width, max_height). Decoded images
+    are kept in memory up to `max_memory` bytes (least recently used
+    ones are dropped first) and every thumbnail is also saved to disk,
+    compressed, so it survives across sessions.
+
+    Callers get their own copy of each image (they are free to
+    resize it in place).
+    """
+
+    def __init__(self, path=None, max_memory=64 * 1024 * 1024, max_disk_size=256 * 1024 * 1024):
+        self.path = path or (PosixPath(environ['HOME']) / '.cache' / 'fxi' / 'thumbnails')
+        self.path.mkdir(exist_ok=True, parents=True)
+        self.max_memory = max_memory
+        self.max_disk_size = max_disk_size
+
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.disk_size = None
+
+    @staticmethod
+    def get_key(url, max_width, max_height):
+        return sha256(f'{url}|{max_width}|{max_height}'.encode('utf-8')).hexdigest()
+
+    def get_path(self, key):
+        return self.path / key[:2] / f'{key}.{THUMBNAILS_FORMAT.lower()}'
+
+    def get(self, url, max_width, max_height):
+        key = self.get_key(url, max_width, max_height)
+
+        with self.lock:
+            image = self.memory.get(key)
+            if image is not None:
+                self.memory.move_to_end(key)
+                return image.copy()
+
+        path = self.get_path(key)
+        try:
+            image = Image.open(path)
+            image.load()
+        except (FileNotFoundError, OSError):
+            return None
+
+        self.remember(key, image)
+        return image.copy()
+
+    def put(self, url, max_width, max_height, image):
+        key = self.get_key(url, max_width, max_height)
+        self.remember(key, image.copy())
+        self.save(key, image)
+
+    def remember(self, key, image):
+        size = image_size_in_bytes(image)
+        if size > self.max_memory:
+            return
+
+        with self.lock:
+            if key in self.memory:
+                return
+
+            self.memory[key] = image
+            self.memory_size += size
+
+            while self.memory_size > self.max_memory:
+                _, old_image = self.memory.popitem(last=False)
+                self.memory_size -= image_size_in_bytes(old_image)
+
+    def save(self, key, image):
+        path = self.get_path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        to_save = image
+        if THUMBNAILS_FORMAT == 'PNG' and image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            to_save = image.convert('RGBA')
+
+        buffer = BytesIO()
+        to_save.save(buffer, THUMBNAILS_FORMAT)
+        data = buffer.getvalue()
+
+        tmp_path = path.with_name(f'{key}.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(data)
+        tmp_path.rename(path)
+
+        with self.lock:
+            if self.disk_size is None:
+                self.disk_size = sum(entry.stat().st_size for entry in self.path.glob('*/*'))
+            else:
+                self.disk_size += len(data)
+
+            if self.disk_size > self.max_disk_size:
+                self.shrink_disk()
+
+    def shrink_disk(self):
+        # Must be called with `self.lock` held.
+        entries = sorted(
+            (entry.stat().st_atime, entry.stat().st_size, entry)
+            for entry in self.path.glob('*/*')
+        )
+        target_size = self.max_disk_size * 0.9
+        for _, size, entry in entries:
+            if self.disk_size <= target_size:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                continue
+            self.disk_size -= size
+
+
+_thumbnails = None
+_thumbnails_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    global _thumbnails
+
+    with _thumbnails_lock:
+        if _thumbnails is None:
+            _thumbnails = ThumbnailCache()
+        return _thumbnails
+
+
+def load_image(data, max_width, max_height):
+    """
+    Decode `data` into an image that fits inside (max_width, max_height).
+
+    JPEG decoders can scale images down by 1/2, 1/4 or 1/8 while
+    decoding, so we ask for the smallest of these scales that is still
+    bigger than the target size (`draft`) and only then resample it
+    with a good filter. Huge images never get decoded in full.
+    """
+    image = Image.open(BytesIO(data))
+    original_size = width, height = image.size
+
+    scale = min(max_width / width, max_height / height, 1)
+    target_size = (max(round(width * scale), 1), max(round(height * scale), 1))
+
+    image.draft(image.mode, target_size)
+    image.thumbnail(target_size, Image.LANCZOS)
+
+    image.info['original_size'] = original_size
+    return image
+
+
+def fetch_thumbnail(url, max_width, max_height):
+    """
+    Get the image at `url` resized to fit inside (max_width, max_height).
+
+    Freshly decoded images carry their original dimensions
+    in `image.info['original_size']`. Raises `ImageFetchError`
+    if the server doesn't answer with the image.
+    """
+    max_width = max(int(max_width), 1)
+    max_height = max(int(max_height), 1)
+
+    cache = get_thumbnail_cache()
+    image = cache.get(url, max_width, max_height)
+    if image is not None:
+        return image
+
+    response = http_client.get(url)
+    if response.status_code != 200:
+        raise ImageFetchError(f'{url}: HTTP {response.status_code}')
+
+    image = load_image(response.content, max_width, max_height)
+    cache.put(url, max_width, max_height, image)
+    return image
@@ -1,16 +1,60 @@
-from io import BytesIO
+from math import ceil
+import threading
 import tkinter
 from tkinter import ttk
 
 from PIL.ImageTk import PhotoImage
 from PIL import Image
-import requests
 
+from fxi.dispatcher import post, ui_call, ui_operation
+from fxi.scheduler import PRIORITY_PREFETCH, PRIORITY_VISIBLE
+from fxi.images import fetch_thumbnail, ImageFetchError, UNLIMITED
 from fxi.utils import apply_surrogates
+from fxi.widgets.scrollables import find_scrolled_frame
+
+
+# How many rows are grouped into a single block:
+BLOCK_SIZE = 50
+
+# How many unused widgets we keep around to be reused:
+MAX_POOL_SIZE = 4 * BLOCK_SIZE
+
+# Rough measures used to guess the height of blocks
+# that were never displayed:
+LINE_HEIGHT = 24
+HEADER_LINE_HEIGHT = 30
+CHAR_WIDTH = 9
+HR_HEIGHT = 4
+
+FIXED_FONT = ('Terminus', 12)
+
+
+def estimate_row_height(row, width):
+    kind = row[0]
+
+    if kind == 'hr':
+        return HR_HEIGHT
+
+    if kind == 'image':
+        return row[1].height()
+
+    if kind == 'header':
+        return HEADER_LINE_HEIGHT
+
+    chars_per_line = max(width // CHAR_WIDTH, 1)
+    num_lines = sum(
+        max(ceil(len(line) / chars_per_line), 1)
+        for line in row[1].split('\n')
+    )
+    return num_lines * LINE_HEIGHT
 
 
 class LazySlot(ttk.Label):
+    @ui_operation
     def write(self, what):
+        if not self.master.alive:
+            return
+
         if isinstance(what, PhotoImage):
             self.write_image(what)
             return
@@ -21,24 +65,30 @@ class LazySlot(ttk.Label):
         if not self.master.alive:
             return
 
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(response.status_code)
-            print(response.content)
-            return
+        max_width = self.master.master.winfo_width() * 0.95
+        max_height = UNLIMITED
+        if dimensions:
+            max_width = min(max_width, dimensions[0])
+            max_height = dimensions[1]
 
-        image_data = response.content
-        image_buffer = BytesIO(image_data)
-        image = Image.open(image_buffer)
+        try:
+            image = fetch_thumbnail(url, max_width, max_height)
+        except ImageFetchError as ex:
+            self.master.report_error(ex)
+            return
 
-        self.write_image(image, dimensions)
+        self.show_image(image)
         return image
 
+    @ui_operation
     def write_image(self, image, dimensions=None):
+        if not self.master.alive:
+            return
+
         max_width = self.master.master.winfo_width() * 0.95
 
         if dimensions:
-            image.thumbnail(dimensions)
+            image.thumbnail(dimensions, Image.LANCZOS)
 
         width, height = image.size
         if width > max_width:
@@ -46,7 +96,14 @@ class LazySlot(ttk.Label):
             image.thumbnail((
                 int(width * p),
                 int(height * p)
-            ))
+            ), Image.LANCZOS)
+
+        self.show_image(image)
+
+    @ui_operation
+    def show_image(self, image):
+        if not self.master.alive:
+            return
 
         photoimage = PhotoImage(image)
 
@@ -61,20 +118,231 @@ class LazySlot(ttk.Label):
         self.master.images.append(photoimage)
 
 
+class MonitorBlock:
+    """
+    A run of consecutive rows of a monitor, displayed inside one frame.
+
+    Only blocks near the visible area of the tab get real widgets
+    ("materialized"). The others are just empty frames with the
+    height they would have, so the scrollbar keeps making sense.
+    """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.rows = []
+        self.widgets = []
+        self.materialized = False
+        self.height = 0
+
+        self.frame = ttk.Frame(monitor)
+        self.frame.pack_propagate(False)
+        self.frame.pack(expand=True, fill=tkinter.X)
+
+    def add_row(self, row, width):
+        self.rows.append(row)
+        if not self.materialized:
+            self.height += estimate_row_height(row, width)
+            self.frame.configure(height=self.height)
+
+    def materialize(self):
+        for row in self.rows[len(self.widgets):]:
+            widget = self.monitor.get_row_widget(row)
+            widget.pack(in_=self.frame, expand=True, fill=tkinter.X)
+            widget.lift()
+            self.widgets.append(widget)
+
+        if not self.materialized:
+            self.frame.pack_propagate(True)
+            self.materialized = True
+
+    def virtualize(self):
+        if not self.materialized:
+            return
+
+        height = self.frame.winfo_height()
+        if height > 1:
+            self.height = height
+
+        self.frame.configure(height=self.height)
+        self.frame.pack_propagate(False)
+
+        for widget in self.widgets:
+            widget.pack_forget()
+            self.monitor.release_row_widget(widget)
+        self.widgets = []
+        self.materialized = False
+
+    def destroy(self):
+        for widget in self.widgets:
+            widget.destroy()
+        self.widgets = []
+        self.frame.destroy()
+
+
 class MonitorFrame(ttk.Frame):
+    """
+    A place to write text, headers, images and "slots" into.
+
+    Writing only appends rows to `self.rows` (any thread can do it);
+    the widgets are created later, on the main loop, and only for the
+    rows that are close to the visible area of the tab. Unused widgets
+    are kept in a pool and reused.
+    """
+
     def __init__(self, parent, *args, **kwargs):
         self.parent = parent
         self.lines = []
         self.images = []
         self.alive = True
+        self.scope = getattr(parent, 'scope', None)
+        self.app = getattr(parent, 'app', None)
+
+        self.rows = []
+        self.rows_lock = threading.Lock()
+        self.laid_out_rows = 0
+        self.cleared = False
+        self.blocks = []
+        self.current_block = None
+        self.pool = {'label': [], 'separator': []}
+        self.layout_pending = False
+        self.viewport_update_pending = False
+
         super().__init__(parent, *args, **kwargs)
 
+        self.scrolled_frame = find_scrolled_frame(self)
+        if self.scrolled_frame is not None:
+            self.scrolled_frame.add_scroll_listener(self.schedule_viewport_update)
+
     @property
     def width(self):
         return self.master.master.winfo_width()
 
+    def enqueue(self, function, *args, **kwargs):
+        """Run `function` in background, unless this monitor gets closed first."""
+        self.scope.submit(function, args, kwargs, PRIORITY_VISIBLE)
+
+    def prefetch(self, function, *args, **kwargs):
+        """Same as `enqueue`, but after everything that is visible right now."""
+        self.scope.submit(function, args, kwargs, PRIORITY_PREFETCH)
+
+    def add_row(self, row):
+        if not self.alive:
+            return
+
+        with self.rows_lock:
+            self.rows.append(row)
+        self.schedule_layout()
+
+    def schedule_layout(self):
+        if not self.layout_pending:
+            self.layout_pending = True
+            post(self.layout)
+
+    def layout(self):
+        self.layout_pending = False
+        if not self.alive:
+            return
+
+        with self.rows_lock:
+            cleared = self.cleared
+            self.cleared = False
+            new_rows = self.rows[self.laid_out_rows:]
+            self.laid_out_rows = len(self.rows)
+
+        if cleared:
+            self.destroy_rows_widgets()
+
+        width = self.width
+        for row in new_rows:
+            if row[0] == 'widget':
+                row[1].pack(expand=True, fill=tkinter.X)
+                self.current_block = None
+                continue
+
+            block = self.current_block
+            if block is None or len(block.rows) >= BLOCK_SIZE:
+                block = self.current_block = MonitorBlock(self)
+                self.blocks.append(block)
+            block.add_row(row, width)
+
+        self.update_viewport()
+
+    def schedule_viewport_update(self):
+        if not self.alive or not self.winfo_exists():
+            if self.scrolled_frame is not None:
+                self.scrolled_frame.remove_scroll_listener(self.schedule_viewport_update)
+            return
+
+        if not self.viewport_update_pending:
+            self.viewport_update_pending = True
+            self.after_idle(self.update_viewport)
+
+    def update_viewport(self):
+        self.viewport_update_pending = False
+        if not self.alive or not self.blocks:
+            return
+
+        self.update_idletasks()
+
+        if self.scrolled_frame is None:
+            for block in self.blocks:
+                block.materialize()
+            return
+
+        canvas = self.scrolled_frame.canvas
+        view_top = canvas.winfo_rooty()
+        view_height = canvas.winfo_height()
+        margin = view_height
+
+        for block in self.blocks:
+            top = block.frame.winfo_rooty() - view_top
+            bottom = top + max(block.frame.winfo_height(), block.height)
+            if bottom >= -margin and top <= view_height + margin:
+                block.materialize()
+            else:
+                block.virtualize()
+
+    def get_row_widget(self, row):
+        kind = row[0]
+
+        if kind == 'hr':
+            if self.pool['separator']:
+                return self.pool['separator'].pop()
+            return ttk.Separator(self)
+
+        if self.pool['label']:
+            label = self.pool['label'].pop()
+        else:
+            label = ttk.Label(self, anchor=tkinter.W, justify=tkinter.LEFT)
+
+        if kind == 'image':
+            label.configure(image=row[1], text='', style='TLabel', font='', wraplength=0)
+        elif kind == 'header':
+            label.configure(image='', text=row[1], style=f'{row[2]}.TLabel', font='', wraplength=0)
+        else:
+            label.configure(
+                image='',
+                text=row[1],
+                style='TLabel',
+                font=row[2] or '',
+                wraplength=self.width
+            )
+        return label
+
+    def release_row_widget(self, widget):
+        if isinstance(widget, ttk.Separator):
+            pool = self.pool['separator']
+        else:
+            pool = self.pool['label']
+            widget.configure(image='')
+
+        if len(pool) < MAX_POOL_SIZE:
+            pool.append(widget)
+        else:
+            widget.destroy()
+
     def write_fixed(self, what, indentation=0):
-        return self.write_string(what, indentation, font=('Terminus', 12))
+        return self.write_string(what, indentation, font=FIXED_FONT)
 
     def write(self, what, indentation=0):
         if not self.alive:
@@ -89,30 +357,31 @@ class MonitorFrame(ttk.Frame):
         if not self.alive:
             return
 
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(response.status_code)
-            print(response.content)
+        try:
+            image = fetch_thumbnail(url, self.width * 0.95, UNLIMITED)
+        except ImageFetchError as ex:
+            self.report_error(ex)
             return
 
-        image_data = response.content
-        image_buffer = BytesIO(image_data)
-        image = Image.open(image_buffer)
-        photoimage = PhotoImage(image)
-        self.write_image(photoimage, *args, **kwargs)
-        return photoimage
+        self.show_image(image, *args, **kwargs)
+        return image
+
+    def report_error(self, ex):
+        # Failing images shouldn't stop whatever is being written:
+        if self.app is not None:
+            the_type = type(ex)
+            self.app.info(f'{the_type}: {ex}')
+
+    @ui_operation
+    def show_image(self, image, *args, **kwargs):
+        if not self.alive:
+            return
+
+        self.write_image(PhotoImage(image), *args, **kwargs)
 
     def write_image(self, image, indentation=0):
-        label = ttk.Label(
-            self,
-            image=image,
-            anchor=tkinter.W,
-            justify=tkinter.CENTER,
-            width=self.width
-        )
-        label.pack(expand=True, fill=tkinter.X)
-        self.lines.append(label)
         self.images.append(image)
+        self.add_row(('image', image))
 
     def write_string(self, message, indentation=0, font=None):
         message = apply_surrogates(message)
@@ -125,46 +394,36 @@ class MonitorFrame(ttk.Frame):
         else:
             formatted_message = f'{message}'
 
-        label = ttk.Label(
-            self,
-            text=formatted_message,
-            anchor=tkinter.W,
-            justify=tkinter.LEFT,
-            wraplength=self.width
-        )
-        if font:
-            label.configure(font=font)
-        label.pack(expand=True, fill=tkinter.X)
-        self.lines.append(label)
-        return label
+        self.add_row(('text', formatted_message, font))
 
+    @ui_operation
     def top(self):
         self.master.master.master.canvas.yview_scroll(-1000, "pages")
 
+    @ui_operation
     def page_down(self):
         self.master.master.master.page_down()
 
+    @ui_call
     def add_slot(self, *args, **kwargs):
         slot = LazySlot(self, *args, **kwargs)
-        self.lines.append(slot)
-        slot.pack(expand=True, fill=tkinter.X)
+        self.add_widget(slot)
         return slot
 
+    def add_widget(self, widget):
+        # Must be called from the main loop. Lay out what is pending first,
+        # so a pending `clear` doesn't destroy the new widget.
+        self.layout()
+        self.lines.append(widget)
+        self.add_row(('widget', widget))
+        self.layout()
+
     def hr(self):
-        separator = ttk.Separator(self)
-        separator.pack(fill=tkinter.X, expand=True)
+        self.add_row(('hr',))
 
     def header(self, title, style):
         text = apply_surrogates(title)
-        label = ttk.Label(
-            self,
-            text=text,
-            anchor=tkinter.W,
-            justify=tkinter.LEFT,
-            style=f'{style}.TLabel'
-        )
-        label.pack(expand=True, fill=tkinter.X)
-        self.lines.append(label)
+        self.add_row(('header', text, style))
 
     def h1(self, title):
         return self.header(title, 'h1')
@@ -176,16 +435,42 @@ class MonitorFrame(ttk.Frame):
         return self.header(title, 'h3')
 
     def clear(self):
+        if not self.alive:
+            return
+
+        with self.rows_lock:
+            self.rows = []
+            self.laid_out_rows = 0
+            self.cleared = True
+        self.schedule_layout()
+        self.top()
+
+    def destroy_rows_widgets(self):
+        for block in self.blocks:
+            block.destroy()
+        self.blocks = []
+        self.current_block = None
+
         for line in self.lines:
-            line.destroy()
+            if isinstance(line, MonitorFrame):
+                # Frame slots listen to scrolling, too:
+                line.close()
+            else:
+                line.destroy()
         self.lines = []
-        self.top()
+        self.images = []
 
     def close(self):
         self.alive = False
-        self.images = []
-        for line in self.lines:
-            line.destroy()
+        self.destroy_widgets()
+
+    @ui_operation
+    def destroy_widgets(self):
+        if self.scrolled_frame is not None:
+            self.scrolled_frame.remove_scroll_listener(self.schedule_viewport_update)
+
+        self.destroy_rows_widgets()
+        self.rows = []
         self.destroy()
 
 
@@ -198,11 +483,150 @@ class LazyFrameSlot(MonitorFrame):
 class Monitor(MonitorFrame):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent.tab.interior, *args, **kwargs)
+        self.app = parent
+        self.scope = parent.executor.new_scope()
         self.frames = []
         self.configure(relief=tkinter.SUNKEN)
 
+    def close(self):
+        self.scope.cancel()
+        super().close()
+
+    @ui_call
     def add_frame_slot(self, *args, **kwargs):
         frame_slot = LazyFrameSlot(self, *args, **kwargs)
         self.frames.append(frame_slot)
-        frame_slot.pack(expand=True, fill=tkinter.X)
+        self.add_widget(frame_slot)
         return frame_slot
+
+
+class TextMonitor(Monitor):
+    """
+    A Monitor that writes everything into a single `tkinter.Text`.
+
+    Made for long runs of plain text (lyrics, articles, message
+    bodies...): there is no widget per line at all, just tagged ranges
+    of text, and clearing it is a single `delete` call. Rows are
+    inserted in chunks of `CHUNK_SIZE` so the interface keeps
+    responding while huge outputs are rendered.
+    """
+
+    CHUNK_SIZE = 1000
+
+    def __init__(self, parent, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+
+        self.font_tags = {}
+        self.resize_pending = False
+
+        style = ttk.Style()
+        self.text = tkinter.Text(
+            self,
+            wrap=tkinter.WORD,
+            borderwidth=0,
+            highlightthickness=0,
+            background='white',
+            font=style.lookup('TLabel', 'font') or 'TkDefaultFont',
+            height=1,
+            state=tkinter.DISABLED
+        )
+        for name in ('h1', 'h2', 'h3'):
+            self.text.tag_configure(name, font=style.lookup(f'{name}.TLabel', 'font'))
+        self.text.tag_configure('hr', background='gray', font=('Terminus', 1))
+
+        self.pack_propagate(False)
+        self.text.pack(expand=True, fill=tkinter.BOTH)
+        self.text.bind('<Configure>', lambda event: self.schedule_resize())
+
+    def get_font_tag(self, font):
+        if font is None:
+            return 'text'
+
+        tag = self.font_tags.get(font)
+        if tag is None:
+            tag = self.font_tags[font] = f'font{len(self.font_tags)}'
+            self.text.tag_configure(tag, font=font)
+        return tag
+
+    def layout(self):
+        self.layout_pending = False
+        if not self.alive:
+            return
+
+        with self.rows_lock:
+            cleared = self.cleared
+            self.cleared = False
+            new_rows = self.rows[self.laid_out_rows:self.laid_out_rows + self.CHUNK_SIZE]
+            self.laid_out_rows += len(new_rows)
+            has_more = self.laid_out_rows < len(self.rows)
+
+        self.text.configure(state=tkinter.NORMAL)
+
+        if cleared:
+            self.text.delete('1.0', tkinter.END)
+            self.destroy_rows_widgets()
+
+        # Consecutive rows with the same tag are inserted as one string:
+        chunks = []
+        for row in new_rows:
+            kind = row[0]
+
+            if kind in ('image', 'widget'):
+                self.insert_chunks(chunks)
+                chunks = []
+                if kind == 'image':
+                    self.text.image_create(tkinter.END, image=row[1])
+                else:
+                    self.text.window_create(tkinter.END, window=row[1], stretch=True)
+                self.text.insert(tkinter.END, '\n')
+                continue
+
+            if kind == 'hr':
+                tag, line = 'hr', ''
+            elif kind == 'header':
+                tag, line = row[2], row[1]
+            else:
+                tag, line = self.get_font_tag(row[2]), row[1]
+
+            if chunks and chunks[-1][0] == tag:
+                chunks[-1][1].append(line)
+            else:
+                chunks.append((tag, [line]))
+        self.insert_chunks(chunks)
+
+        self.text.configure(state=tkinter.DISABLED)
+        self.schedule_resize()
+
+        # Let the main loop breathe before the next chunk:
+        if has_more:
+            self.layout_pending = True
+            self.after(1, self.layout)
+
+    def insert_chunks(self, chunks):
+        args = []
+        for tag, lines in chunks:
+            args.append('\n'.join(lines) + '\n')
+            args.append(tag)
+
+        if args:
+            self.text.insert(tkinter.END, *args)
+
+    def schedule_resize(self):
+        if not self.resize_pending and self.alive:
+            self.resize_pending = True
+            self.after_idle(self.resize)
+
+    def resize(self):
+        # The text itself never scrolls: it gets as tall as its
+        # content and the tab scrolls instead.
+        self.resize_pending = False
+        if not self.alive:
+            return
+
+        height = self.text.count('1.0', tkinter.END, 'update', 'ypixels')
+        if isinstance(height, tuple):
+            height = height[0]
+        self.configure(height=(height or 0) + 4)
+
+    def update_viewport(self):
+        self.viewport_update_pending = False
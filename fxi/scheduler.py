@@ -0,0 +1,248 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+# Lower values run first.
+PRIORITY_COMMAND = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_BACKGROUND = 3
+
+
+class CancellationScope:
+    """
+    Groups tasks so they can be dropped all at once,
+    like everything a monitor asked for when it gets closed.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.cancelled = False
+
+    def submit(self, function, args=(), kwargs=None, priority=PRIORITY_VISIBLE):
+        self.queue.submit_task(function, args, kwargs, priority, self)
+
+    def cancel(self):
+        self.cancelled = True
+        self.queue.cancel(self)
+
+
+class TaskQueue:
+    """
+    The tasks of one application inside the `Scheduler`.
+
+    Pending tasks run by priority (see `PRIORITY_*`) and, inside
+    the same priority, in the order they were submitted. No more than
+    `max_workers` of them run at the same time.
+    """
+
+    def __init__(self, scheduler, name, max_workers=8, on_error=None):
+        self.scheduler = scheduler
+        self.name = name
+        self.max_workers = max_workers
+        self.on_error = on_error
+
+        self.tasks = []
+        self.counter = itertools.count()
+        self.alive = True
+
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_time = 0
+        self.total_run_time = 0
+
+    @property
+    def queue_size(self):
+        return len(self.tasks)
+
+    @property
+    def average_wait_time(self):
+        started = self.completed + self.failed + self.active
+        if started == 0:
+            return 0
+        return self.total_wait_time / started
+
+    @property
+    def average_run_time(self):
+        finished = self.completed + self.failed
+        if finished == 0:
+            return 0
+        return self.total_run_time / finished
+
+    def new_scope(self):
+        return CancellationScope(self)
+
+    def submit(self, function, *args, **kwargs):
+        self.submit_task(function, args, kwargs)
+
+    def submit_task(self, function, args=(), kwargs=None, priority=PRIORITY_VISIBLE, scope=None):
+        with self.scheduler.condition:
+            if not self.alive or (scope is not None and scope.cancelled):
+                return
+
+            task = (priority, next(self.counter), function, args, kwargs or {}, scope, time.time())
+            heapq.heappush(self.tasks, task)
+            self.submitted += 1
+            self.scheduler.task_submitted()
+
+    def cancel(self, scope):
+        with self.scheduler.condition:
+            self.tasks = [task for task in self.tasks if task[5] is not scope]
+            heapq.heapify(self.tasks)
+
+    def report_error(self, function, ex):
+        traceback.print_exc()
+        if self.on_error is not None:
+            try:
+                self.on_error(function, ex)
+            except Exception:
+                traceback.print_exc()
+
+    def shutdown(self):
+        self.scheduler.remove_queue(self)
+
+
+class Scheduler:
+    """
+    A single pool of worker threads shared by every running app.
+
+    Never more than `max_workers` threads exist. Workers are started
+    on demand, wake up as soon as something is submitted and exit after
+    `idle_timeout` seconds without work. Each app has its own
+    `TaskQueue` and workers serve them in turns, so an app with
+    hundreds of pending downloads can't starve the others.
+    """
+
+    def __init__(self, max_workers=16, idle_timeout=60):
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+
+        self.condition = threading.Condition()
+        self.queues = []
+        self.next_queue_index = 0
+        self.workers = set()
+        self.idle_workers = 0
+        self.alive = True
+
+    @property
+    def workers_count(self):
+        return len(self.workers)
+
+    @property
+    def active_workers_count(self):
+        return len(self.workers) - self.idle_workers
+
+    @property
+    def queue_size(self):
+        return sum(queue.queue_size for queue in self.queues)
+
+    def new_queue(self, name, max_workers=8, on_error=None):
+        queue = TaskQueue(self, name, max_workers, on_error)
+        with self.condition:
+            self.queues.append(queue)
+        return queue
+
+    def remove_queue(self, queue):
+        with self.condition:
+            queue.alive = False
+            queue.tasks.clear()
+            if queue in self.queues:
+                self.queues.remove(queue)
+
+    @property
+    def runnable_tasks_count(self):
+        """Pending tasks that could start right now (their queue isn't at its limit)."""
+        return sum(
+            min(queue.queue_size, queue.max_workers - queue.active)
+            for queue in self.queues
+            if queue.active < queue.max_workers
+        )
+
+    def task_submitted(self):
+        # Must be called with `self.condition` held.
+        if self.runnable_tasks_count > self.idle_workers and len(self.workers) < self.max_workers:
+            self.start_worker()
+        self.condition.notify()
+
+    def start_worker(self):
+        # Must be called with `self.condition` held.
+        worker = threading.Thread(target=self.work, name='fxi-worker', daemon=True)
+        self.workers.add(worker)
+        worker.start()
+
+    def pick_task(self):
+        # Must be called with `self.condition` held.
+        # Round-robin between the queues that have something to run.
+        num_queues = len(self.queues)
+        for offset in range(num_queues):
+            index = (self.next_queue_index + offset) % num_queues
+            queue = self.queues[index]
+            if queue.tasks and queue.active < queue.max_workers:
+                self.next_queue_index = (index + 1) % num_queues
+                return queue, heapq.heappop(queue.tasks)
+        return None
+
+    def get_task(self):
+        with self.condition:
+            self.idle_workers += 1
+            try:
+                picked = self.pick_task()
+                while self.alive and picked is None:
+                    if not self.condition.wait(timeout=self.idle_timeout):
+                        picked = self.pick_task()
+                        break
+                    picked = self.pick_task()
+
+                if not self.alive or picked is None:
+                    self.workers.discard(threading.current_thread())
+                    return None
+
+                queue, task = picked
+                queue.active += 1
+                queue.total_wait_time += time.time() - task[6]
+                return picked
+            finally:
+                self.idle_workers -= 1
+
+    def work(self):
+        while True:
+            picked = self.get_task()
+            if picked is None:
+                return
+
+            queue, task = picked
+            _, _, function, args, kwargs, scope, _ = task
+
+            started_at = time.time()
+            failed = False
+            if scope is None or not scope.cancelled:
+                try:
+                    function(*args, **kwargs)
+                except Exception as ex:
+                    failed = True
+                    queue.report_error(function, ex)
+
+            with self.condition:
+                queue.active -= 1
+                queue.total_run_time += time.time() - started_at
+                if failed:
+                    queue.failed += 1
+                else:
+                    queue.completed += 1
+
+                # A queue that reached its own limit may have work waiting:
+                if queue.tasks:
+                    self.condition.notify()
+
+    def shutdown(self):
+        with self.condition:
+            self.alive = False
+            for queue in self.queues:
+                queue.alive = False
+                queue.tasks.clear()
+            self.condition.notify_all()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0x94bafcbe
+# __coconut_hash__ = 0xf56d3b66
 
 # Compiled with Coconut version 1.4.0 [Ernest Scribbler]
 
@@ -550,14 +550,16 @@ _coconut_MatchError, _coconut_count, _coconut_enumerate, _coconut_makedata, _coc
 
 # Compiled Coconut: -----------------------------------------------------------
 
-from io import BytesIO
 import tkinter
 from tkinter import ttk
 
 from PIL.ImageTk import PhotoImage
-from PIL import Image
-import requests
 
+from fxi.dispatcher import ui_operation
+from fxi.scheduler import PRIORITY_PREFETCH
+from fxi.scheduler import PRIORITY_VISIBLE
+from fxi.images import fetch_thumbnail
+from fxi.images import ImageFetchError
 from fxi.utils import apply_surrogates
 
 
@@ -601,14 +603,25 @@ class Slide(ttk.Frame):
         return _coconut_tail_call(self.master.master.winfo_height)
 
     def set_image_from_url(self, url, thumb_dimensions=None):
-        self.app.enqueue(self.do_set_image_from_url, url, thumb_dimensions)
+        slides = self.slideshow.slides
+        index = slides.index(self) if self in slides else len(slides)
+
+# Only the slides around the current one are "visible":
+        if abs(index - self.slideshow.index) <= 1:
+            self.slideshow.enqueue(self.do_set_image_from_url, url, thumb_dimensions)
+        else:
+            self.slideshow.prefetch(self.do_set_image_from_url, url, thumb_dimensions)
 
     def set_title(self, title):
         title = apply_surrogates(title)
         self.title = title
 
         if self.rendered:
-            self.title_label.configure(text=title)
+            self.show_title(title)
+
+    @ui_operation
+    def show_title(self, title):
+        self.title_label.configure(text=title)
 
     def set_subtitle(self, title):
         title = apply_surrogates(title)
@@ -618,41 +631,43 @@ class Slide(ttk.Frame):
         if not self.app.alive:
             return
 
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(response.status_code)
-            print(response.content)
-            return
-
-        image_data = response.content
-        image_buffer = BytesIO(image_data)
-        image = Image.open(image_buffer)
-
-        original_dimensions = image.size
+        max_width = self.width * 0.95
+        max_height = self.height * 0.80
 
         if thumb_dimensions:
             width, height = thumb_dimensions
-        else:
-            width, height = image.size
+            p = min(max_width / width, max_height / height, 1)
+            max_width = width * p
+            max_height = height * p
 
-        max_width = self.width * 0.95
-        max_height = self.height * 0.80
+        try:
+            image = fetch_thumbnail(url, max_width, max_height)
+        except ImageFetchError as ex:
+            the_type = type(ex)
+            self.app.info(f'{the_type}: {ex}')
+            return
 
-        pw = max_width / width
-        ph = max_height / height
-        p = min(ph, pw)
-        if p > 1:
-            p = 1
+        self.show_image(image)
 
-        image.thumbnail((int(width * p), int(height * p)))
+    @ui_operation
+    def show_image(self, image):
+        if not self.app.alive:
+            return
 
         photoimage = PhotoImage(image)
         self.image_reference = photoimage
         self.image_slot.configure(image=photoimage)
 
-        label = ttk.Label(self, text=f'(Image dimensions: {original_dimensions} -> {image.size})', anchor=tkinter.W, justify=tkinter.LEFT, style=f'small.TLabel')
+        original_dimensions = image.info.get('original_size')
+        if original_dimensions:
+            dimensions_text = f'(Image dimensions: {original_dimensions} -> {image.size})'
+        else:
+            dimensions_text = f'(Image dimensions: {image.size})'
+
+        label = ttk.Label(self, text=dimensions_text, anchor=tkinter.W, justify=tkinter.LEFT, style=f'small.TLabel')
         label.pack(expand=True, fill=tkinter.X)
 
+    @ui_operation
     def render(self, title):
         if self.rendered:
             return
@@ -684,6 +699,7 @@ class Slide(ttk.Frame):
     def on_refresh(self):
         pass
 
+    @ui_operation
     def refresh(self):
         num_slides = len(self.slideshow.slides)
         idx = self.slideshow.index + 1
@@ -704,6 +720,7 @@ class ImageSlideShow(ttk.Frame):
         self.tab = app.tab
         self.index = 0
         self.slides = slides
+        self.scope = app.executor.new_scope()
 
         self.binded_functions = []
 
@@ -712,9 +729,16 @@ class ImageSlideShow(ttk.Frame):
     def init(self):
         pass
 
+    def enqueue(self, function, *args, **kwargs):
+        self.scope.submit(function, args, kwargs, PRIORITY_VISIBLE)
+
+    def prefetch(self, function, *args, **kwargs):
+        self.scope.submit(function, args, kwargs, PRIORITY_PREFETCH)
+
     def on_render(self):
         pass
 
+    @ui_operation
     def render(self):
         self.app.close_monitor()
         self.app.current_monitor = self
@@ -767,6 +791,11 @@ class ImageSlideShow(ttk.Frame):
         pass
 
     def close(self):
+        self.scope.cancel()
+        self.destroy_slides()
+
+    @ui_operation
+    def destroy_slides(self):
         for fid in self.binded_functions:
             self.tab.unbind_all(fid)
 
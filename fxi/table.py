@@ -1,71 +1,208 @@
+import operator
 import tkinter
 from tkinter import ttk
 
+from fxi.dispatcher import ui_operation
+from fxi.widgets.scrollables import find_scrolled_frame
+
+
+# How many rows above and below the visible ones are kept drawn:
+MARGIN_ROWS = 10
+
+# Used to guess how many characters fit into a cell:
+CHAR_WIDTH = 9
+
+DEFAULT_ROW_HEIGHT = 24
+
+FILTER_OPERATORS = (
+    ('>=', operator.ge),
+    ('<=', operator.le),
+    ('!=', operator.ne),
+    ('>', operator.gt),
+    ('<', operator.lt),
+    ('=', operator.eq),
+)
+
+
+def make_predicate(expression):
+    """
+    Turn a filter expression into a function of a cell value.
+
+    Expressions starting with a comparison operator (">10", "!=0",
+    "=foo"...) compare numbers when the operand is a number and
+    strings otherwise. Anything else matches values containing it,
+    ignoring case.
+    """
+    for symbol, function in FILTER_OPERATORS:
+        if expression.startswith(symbol):
+            operand = expression[len(symbol):].strip()
+            break
+    else:
+        term = expression.lower()
+        return lambda value: term in f'{value}'.lower()
+
+    try:
+        number = float(operand)
+    except ValueError:
+        return lambda value: function(f'{value}', operand)
+
+    def predicate(value):
+        try:
+            return function(float(value), number)
+        except (TypeError, ValueError):
+            return False
+    return predicate
+
+
+def get_sort_key(value):
+    """Numbers (even as strings) first, then other texts, then blanks."""
+    if value is None or value == '':
+        return (2, 0, '')
+    try:
+        return (0, float(value), '')
+    except (TypeError, ValueError):
+        return (1, 0, f'{value}')
+
+
+def argsort(values):
+    """
+    The indexes of `values` in sorted order.
+
+    >>> argsort([10, 9, ''])
+    [1, 0, 2]
+    >>> argsort(['10.0', '9.0', 'abc', None, '-1'])
+    [4, 1, 0, 2, 3]
+    """
+    keys = [get_sort_key(value) for value in values]
+    return sorted(range(len(keys)), key=keys.__getitem__)
+
 
 class Entry:
-    def __init__(self, parent, index, data):
+    """
+    One row of a Table.
+
+    It holds no widgets: the data lives in the table's row store
+    and rows are only drawn while they are close to the visible area.
+    """
+
+    def __init__(self, parent, index):
         self.parent = parent
         self.index = index
-        self.data = data
 
-        self.widgets = []
-        self.marker = None
+    @property
+    def data(self):
+        return self.parent.rows[self.index]
+
+    def __getitem__(self, key):
+        return self.data[key]
 
+    @ui_operation
     def render(self):
-        frame = self.parent.frame
-
-        label = ttk.Label(frame, text=f'{self.index}')
-        label.grid(
-            column=0,
-            row=self.index + 1,
-            padx=10
-        )
-        self.index_marker = label
-        self.widgets.append(label)
-
-        total_width = self.parent.parent.winfo_width()
-        width = total_width / len(self.parent.cells)
-        for cell_index, cell in enumerate(self.parent.cells):
-            for value_index, value in enumerate(self.data[key] for key in cell):
-                label = ttk.Label(
-                    frame,
-                    text=f'{value}',
-                    anchor=tkinter.W,
-                    justify=tkinter.LEFT,
-                    style='cell.TLabel',
-                    wraplength=width
-                )
+        self.parent.redraw_row(self.index)
+
+    @ui_operation
+    def refresh(self, data=None):
+        self.parent.set_row(self.index, data)
+
+    @ui_operation
+    def mark_as(self, mark):
+        if mark == 'loading':
+            mark = '*'
+        self.parent.marks[self.index] = mark
+        self.parent.redraw_row(self.index)
+
+
+class Entries:
+    """A lazy sequence of `Entry` objects, one for each row of a Table."""
+
+    def __init__(self, table):
+        self.table = table
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.table.rows)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.get(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get(index)
+
+    def get(self, index):
+        entry = self.cache.get(index)
+        if entry is None:
+            entry = self.cache[index] = Entry(self.table, index)
+        return entry
+
+
+class RowWidgets:
+    """A reusable grid row of labels, showing one row of the table at a time."""
+
+    def __init__(self, table, grid_row):
+        self.table = table
+        self.grid_row = grid_row
+        self.index = None
+
+        self.marker = ttk.Label(table.frame)
+        self.labels = [
+            ttk.Label(
+                table.frame,
+                anchor=tkinter.W,
+                justify=tkinter.LEFT,
+                style='cell.TLabel'
+            )
+            for cell in table.cells
+        ]
+        self.texts = [None] * len(self.labels)
+        self.wrap_length = 0
+        self.visible = False
+
+    def set_wrap_length(self, wrap_length):
+        if self.wrap_length != wrap_length:
+            for label in self.labels:
+                label.configure(wraplength=wrap_length)
+            self.wrap_length = wrap_length
+
+    def show(self, index, texts, marker):
+        if self.marker['text'] != marker:
+            self.marker['text'] = marker
+
+        for position, text in enumerate(texts):
+            if self.texts[position] != text:
+                self.labels[position].configure(text=text)
+                self.texts[position] = text
+
+        if not self.visible:
+            self.marker.grid(column=0, row=self.grid_row, padx=10)
+            for position, label in enumerate(self.labels):
                 label.grid(
-                    column=cell_index + 1,
-                    row=self.index + 1,
+                    column=position + 1,
+                    row=self.grid_row,
                     padx=10,
                     pady=1,
                     sticky=tkinter.W
                 )
-                self.widgets.append(label)
-
-    def destroy(self):
-        for widget in self.widgets:
-            for slave in widget.grid_slaves():
-                slave.destroy()
-            widget.destroy()
-        self.widgets = []
+            self.visible = True
 
-    def refresh(self, data=None):
-        if data:
-            self.data = data
-        self.destroy()
-        self.render()
+        self.index = index
 
-    def mark_as(self, mark):
-        if self.index_marker:
-            if mark == 'loading':
-                new_text = "*"
-            else:
-                new_text = mark
+    def hide(self):
+        if self.visible:
+            self.marker.grid_remove()
+            for label in self.labels:
+                label.grid_remove()
+            self.visible = False
+        self.index = None
 
-            self.index_marker['text'] = new_text
-            self.index_marker.update()
+    def destroy(self):
+        self.marker.destroy()
+        for label in self.labels:
+            label.destroy()
 
 
 class EntryCommand:
@@ -76,17 +213,75 @@ class EntryCommand:
 
 
 class Table:
-    def __init__(self, parent, cells, headers=None):
+    """
+    A table that can hold tens of thousands of rows.
+
+    Rows are stored column by column (`self.columns`, one list per key)
+    besides the original data (`self.rows`). Only the rows near the
+    visible area of the tab are drawn, into a small pool of reused
+    labels; spacers above and below them keep the table as tall as if
+    every row was there, so scrolling costs the same whatever the
+    number of rows.
+
+    Cells show only their first line, cut to the column width, unless
+    `wrap` is set: then every row is drawn, with the whole text wrapped
+    (for small tables, like the ones inside pages).
+    """
+
+    def __init__(self, parent, cells, headers=None, wrap=False):
         self.parent = parent
+        self.wrap = wrap
         frame = ttk.Frame(parent, borderwidth=1, relief=tkinter.RIDGE)
         self.frame = frame
         self.cells = cells
         self.headers = headers or []
         self.commands = {}
 
-        self.entries = []
+        self.keys = tuple(key for cell in cells for key in cell)
+        self.rows = []
+        self.columns = {key: [] for key in self.keys}
+        self.marks = {}
+        self.entries = Entries(self)
+
+        # Sorting and filtering:
+        self.sort_indexes = {}
+        self.sort_key = None
+        self.sort_reverse = False
+        self.filters = {}
+        self.view = None
+
+        self.pool = []
+        self.first_row = 0
+        self.row_height = None
+        self.headers_rendered = False
+        self.update_pending = False
+        self.scrolled_frame = None
 
     def render(self, data):
+        if isinstance(data, dict):
+            values = tuple(data.values())
+        else:
+            values = tuple(data)
+
+        self.do_render(values)
+
+    @ui_operation
+    def do_render(self, values):
+        if not self.headers_rendered:
+            self.render_headers()
+
+        self.rows = list(values)
+        self.columns = {
+            key: [row[key] for row in self.rows]
+            for key in self.keys
+        }
+        self.marks = {}
+        self.invalidate_view()
+
+        self.frame.pack(expand=True, fill='x')
+        self.update_window()
+
+    def render_headers(self):
         label = ttk.Label(self.frame, text='#')
         label.grid(column=0, row=0)
 
@@ -103,28 +298,269 @@ class Table:
                 pady=(0, 5)
             )
 
-        if isinstance(data, dict):
-            values = data.values()
+        for index in range(len(self.cells)):
+            self.frame.grid_columnconfigure(index + 1, weight=1, uniform='cells')
+
+        # Spacers standing for the rows above and below the drawn ones:
+        columns_count = len(self.cells) + 1
+        self.top_spacer = ttk.Frame(self.frame, height=0)
+        self.top_spacer.grid(column=0, row=1, columnspan=columns_count, sticky=tkinter.EW)
+        self.bottom_spacer = ttk.Frame(self.frame, height=0)
+
+        self.scrolled_frame = find_scrolled_frame(self.parent)
+        # Wrapped tables draw every row anyway:
+        if self.scrolled_frame is not None and not self.wrap:
+            self.scrolled_frame.add_scroll_listener(self.schedule_update)
+
+        self.headers_rendered = True
+
+    def set_row(self, index, data=None):
+        moved = False
+        if data:
+            self.rows[index] = data
+            for key in self.keys:
+                value = data[key]
+                if self.columns[key][index] == value:
+                    continue
+                self.columns[key][index] = value
+
+                # Only what depends on this very cell is updated:
+                self.sort_indexes.pop(key, None)
+                if key == self.sort_key:
+                    moved = True
+
+                if key in self.filters:
+                    expression, bitmap = self.filters[key]
+                    matches = int(bool(make_predicate(expression)(value)))
+                    if bitmap[index] != matches:
+                        bitmap[index] = matches
+                        moved = True
+        self.marks.pop(index, None)
+
+        if moved:
+            # The row has moved or (dis)appeared:
+            self.view = None
+            self.schedule_update()
         else:
-            values = data
+            self.redraw_row(index)
 
-        for row_index, entry_data in enumerate(values):
-            entry = Entry(self, row_index, entry_data)
-            self.entries.append(entry)
-            entry.render()
+    def get_column_key(self, name):
+        """Find the key of a column by its header, key or number (starting at 1)."""
+        for index, header in enumerate(self.headers):
+            if header.lower() == name.lower():
+                return self.cells[index][0]
 
-        self.frame.pack(expand=True, fill='x')
+        for key in self.keys:
+            if f'{key}' == name:
+                return key
+
+        if name.isdigit() and 0 < int(name) <= len(self.cells):
+            return self.cells[int(name) - 1][0]
+
+        return None
+
+    def get_sort_index(self, key):
+        sort_index = self.sort_indexes.get(key)
+        if sort_index is None:
+            sort_index = self.sort_indexes[key] = argsort(self.columns[key])
+        return sort_index
+
+    @ui_operation
+    def sort(self, key=None, reverse=False):
+        """Show rows ordered by `key` (or in their original order, if None)."""
+        self.sort_key = key
+        self.sort_reverse = reverse
+        self.view = None
+        self.update_window()
+
+    @ui_operation
+    def filter(self, key=None, expression=None):
+        """
+        Show only rows whose `key` value matches `expression`.
+
+        Filters on different columns are combined. Without
+        an expression the filter of `key` is removed and without
+        a key every filter is.
+        """
+        if key is None:
+            self.filters = {}
+        elif not expression:
+            self.filters.pop(key, None)
+        else:
+            predicate = make_predicate(expression)
+            bitmap = bytearray(map(predicate, self.columns[key]))
+            self.filters[key] = (expression, bitmap)
+
+        self.view = None
+        self.update_window()
+
+    def invalidate_view(self):
+        self.sort_indexes = {}
+        for key, (expression, _) in tuple(self.filters.items()):
+            predicate = make_predicate(expression)
+            self.filters[key] = (expression, bytearray(map(predicate, self.columns[key])))
+        self.view = None
+
+    def get_view(self):
+        """The indexes of the rows to show, in the order they are shown."""
+        if self.view is not None:
+            return self.view
+
+        if self.sort_key is None and not self.filters:
+            return range(len(self.rows))
+
+        if self.sort_key is None:
+            order = range(len(self.rows))
+        else:
+            order = self.get_sort_index(self.sort_key)
+            if self.sort_reverse:
+                order = order[::-1]
+
+        if self.filters:
+            bitmaps = [bitmap for _, bitmap in self.filters.values()]
+            combined = bitmaps[0]
+            for bitmap in bitmaps[1:]:
+                mask = int.from_bytes(combined, 'little') & int.from_bytes(bitmap, 'little')
+                combined = mask.to_bytes(len(combined), 'little')
+            order = [index for index in order if combined[index]]
+
+        self.view = order
+        return order
+
+    def get_texts(self, index, max_chars):
+        texts = []
+        for cell in self.cells:
+            text = ' '.join(f'{self.columns[key][index]}' for key in cell)
+            if self.wrap:
+                texts.append(text)
+                continue
+
+            text = text.split('\n', 1)[0]
+            if len(text) > max_chars:
+                text = text[:max_chars - 1] + '…'
+            texts.append(text)
+        return texts
+
+    def get_column_width(self):
+        total_width = max(self.frame.winfo_width(), self.parent.winfo_width())
+        return total_width / max(len(self.cells), 1)
+
+    def get_max_chars(self):
+        return max(int(self.get_column_width() / CHAR_WIDTH), 4)
+
+    def get_wrap_length(self):
+        return max(int(self.get_column_width()) - 20, 4 * CHAR_WIDTH)
+
+    def draw_row(self, row_widgets, index, max_chars):
+        marker = self.marks.get(index, f'{index}')
+        row_widgets.show(index, self.get_texts(index, max_chars), marker)
+
+    def redraw_row(self, index):
+        for row_widgets in self.pool:
+            if row_widgets.index == index:
+                self.draw_row(row_widgets, index, self.get_max_chars())
+                return
+
+    def schedule_update(self):
+        if self.update_pending:
+            return
+
+        if not self.frame.winfo_exists():
+            if self.scrolled_frame is not None:
+                self.scrolled_frame.remove_scroll_listener(self.schedule_update)
+            return
+
+        self.update_pending = True
+        self.frame.after_idle(self.update_window)
+
+    def get_visible_range(self, rows_count):
+        if self.wrap:
+            return 0, rows_count
+
+        if self.scrolled_frame is None or self.row_height is None:
+            return 0, min(rows_count, 2 * MARGIN_ROWS)
+
+        canvas = self.scrolled_frame.canvas
+        offset = canvas.winfo_rooty() - self.top_spacer.winfo_rooty()
+        first = max(offset // self.row_height - MARGIN_ROWS, 0)
+        count = canvas.winfo_height() // self.row_height + 2 * MARGIN_ROWS
+        first = min(first, max(rows_count - count, 0))
+        return first, min(first + count, rows_count)
+
+    def update_window(self):
+        """Draw the rows near the visible area into the pool of labels."""
+        self.update_pending = False
+        if not self.headers_rendered or not self.frame.winfo_exists():
+            return
+
+        self.frame.update_idletasks()
+        view = self.get_view()
+        first, last = self.get_visible_range(len(view))
+        count = last - first
+
+        while len(self.pool) < count:
+            self.pool.append(RowWidgets(self, len(self.pool) + 2))
+
+        max_chars = self.get_max_chars()
+        wrap_length = self.get_wrap_length() if self.wrap else 0
+        for position, row_widgets in enumerate(self.pool):
+            row_widgets.set_wrap_length(wrap_length)
+            if position < count:
+                self.draw_row(row_widgets, view[first + position], max_chars)
+            else:
+                row_widgets.hide()
+
+        if self.row_height is None and self.pool and count and self.cells:
+            self.frame.update_idletasks()
+            self.row_height = max(self.pool[0].labels[0].winfo_reqheight() + 2, DEFAULT_ROW_HEIGHT)
+
+        row_height = self.row_height or DEFAULT_ROW_HEIGHT
+        for position in range(len(self.pool)):
+            # Wrapped rows are as tall as their text:
+            minsize = row_height if position < count and not self.wrap else 0
+            self.frame.grid_rowconfigure(position + 2, minsize=minsize)
+
+        self.first_row = first
+        self.top_spacer.configure(height=first * row_height)
+        remaining = len(view) - last
+        if remaining > 0:
+            self.bottom_spacer.configure(height=remaining * row_height)
+            self.bottom_spacer.grid(
+                column=0,
+                row=len(self.pool) + 2,
+                columnspan=len(self.cells) + 1,
+                sticky=tkinter.EW
+            )
+        else:
+            self.bottom_spacer.grid_remove()
 
     def refresh(self):
         for entry in self.entries:
             entry.mark_as('loading')
             entry.refresh()
 
+    @ui_operation
     def clear(self):
+        if self.scrolled_frame is not None:
+            self.scrolled_frame.remove_scroll_listener(self.schedule_update)
+            self.scrolled_frame = None
+
+        if self.headers_rendered:
+            for row_widgets in self.pool:
+                row_widgets.destroy()
+            self.bottom_spacer.destroy()
         for widget in self.frame.grid_slaves():
             widget.destroy()
         self.frame.pack_forget()
-        self.entries = []
+
+        self.rows = []
+        self.columns = {key: [] for key in self.keys}
+        self.marks = {}
+        self.sort_indexes = {}
+        self.view = None
+        self.pool = []
+        self.first_row = 0
+        self.headers_rendered = False
 
     def add_entry_command(self, function, name=None, description=None):
         self.commands[name] = EntryCommand(function, name, description)
@@ -13,16 +13,18 @@ class VerticalScrolledFrame(ttk.Frame):
         super().__init__(parent, *args, **kwargs)
 
         self.binded_functions = []
+        self.scroll_listeners = []
         self.alive = True
 
         # create a canvas object and a vertical scrollbar for scrolling it
         vscrollbar = ttk.Scrollbar(self, orient=VERTICAL)
         vscrollbar.pack(fill=Y, side=RIGHT, expand=FALSE)
+        self.vscrollbar = vscrollbar
         canvas = Canvas(
             self,
             bd=0,
             highlightthickness=0,
-            yscrollcommand=vscrollbar.set,
+            yscrollcommand=self._on_yscroll,
             background='white'
         )
         self.canvas = canvas
@@ -60,6 +62,19 @@ class VerticalScrolledFrame(ttk.Frame):
             # update the inner frame's width to fill the canvas
             self.canvas.itemconfigure(self.interior_id, width=self.canvas.winfo_width())
 
+    def _on_yscroll(self, first, last):
+        self.vscrollbar.set(first, last)
+        for listener in tuple(self.scroll_listeners):
+            listener()
+
+    def add_scroll_listener(self, listener):
+        """Call `listener()` whenever the visible area changes."""
+        self.scroll_listeners.append(listener)
+
+    def remove_scroll_listener(self, listener):
+        if listener in self.scroll_listeners:
+            self.scroll_listeners.remove(listener)
+
     def page_down(self):
         self._configure_canvas(None)
         self.canvas.yview_scroll(1, "pages")
@@ -112,3 +127,12 @@ class VerticalScrolledFrame(ttk.Frame):
         if not self.alive:
             return
         self.canvas.yview_scroll(-1, "pages")
+
+
+def find_scrolled_frame(widget):
+    """The VerticalScrolledFrame `widget` lives in (or None)."""
+    while widget is not None:
+        if isinstance(widget, VerticalScrolledFrame):
+            return widget
+        widget = widget.master
+    return None